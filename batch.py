@@ -0,0 +1,285 @@
+# batch.py
+"""Headless batch processing: load -> optional noise -> filter -> metrics -> save.
+
+Images are streamed from directories, glob patterns or list files through a
+bounded prefetch queue, so memory stays constant however large the corpus is.
+Memory-mapped inputs (.npy, uncompressed .tif) are processed band by band from
+disk to disk instead, so they may be larger than RAM.
+
+Example:
+    python batch.py images/ "scans/**/*.png" --filter "Kuwahara Filter" --noise Gaussian --report outputs/metrics.jsonl
+"""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+import storage
+import tracing
+from processor import ImageProcessor
+from cache import ResultCache
+from noise import NoiseEngine
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".npy")
+LIST_EXTENSIONS = (".txt", ".lst")
+REPORT_FIELDS = ["path", "output", "filter", "noise", "psnr_noisy", "ssim_noisy", "psnr", "ssim", "ssim_method", "seconds", "error"]
+
+
+def iter_image_paths(sources):
+    """Yields (path, name) for images in directories, list files (one path per line) and glob patterns.
+
+    name is the path relative to its input root (the directory, the list
+    file's directory or the fixed prefix of the pattern) without extension;
+    outputs are named after it, so equal file names in different
+    directories do not overwrite each other.
+    """
+    for source in sources:
+        if os.path.isdir(source):
+            for name in sorted(os.listdir(source)):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    path = os.path.join(source, name)
+                    yield path, output_name(path, source)
+        elif source.lower().endswith(LIST_EXTENSIONS) and os.path.isfile(source):
+            with open(source) as list_file:
+                for line in list_file:
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        yield line, output_name(line, os.path.dirname(source))
+        else:
+            root = os.path.dirname(source)
+            while glob.has_magic(root):
+                root = os.path.dirname(root)
+            for path in glob.iglob(source, recursive=True):
+                if os.path.isfile(path):
+                    yield path, output_name(path, root)
+
+
+def output_name(path, root):
+    """path relative to root, without extension; paths outside root keep their whole path."""
+    name = os.path.relpath(path, root or os.curdir)
+    if name == os.pardir or name.startswith(os.pardir + os.sep):
+        name = os.path.splitdrive(os.path.abspath(path))[1].lstrip(os.sep)
+    return os.path.splitext(name)[0]
+
+
+def filter_slug(filter_name):
+    """Same naming scheme the GUI uses for its default save file names."""
+    return filter_name.lower().replace(' ', '_').replace('-', '')
+
+
+class ReportWriter:
+    """Appends one metrics record per image to a JSONL or CSV file, safe to call from workers."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self._csv = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = open(path, "w", newline="")
+            if path.lower().endswith(".csv"):
+                self._csv = csv.DictWriter(self._file, fieldnames=REPORT_FIELDS)
+                self._csv.writeheader()
+
+    def write(self, record):
+        if self._file is None:
+            return
+        with self._lock:
+            if self._csv is not None:
+                self._csv.writerow(record)
+            else:
+                self._file.write(json.dumps(record) + "\n")
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def process_image(processor, path, name, image, args):
+    """Runs one RGB image through noise, filter, metrics and save; returns its report record.
+
+    Outputs go to args.output/name_<suffix>, name being from iter_image_paths.
+    """
+    record = dict.fromkeys(REPORT_FIELDS)
+    record.update(path=path, filter=args.filter, noise=args.noise)
+    start = time.perf_counter()
+    base = os.path.join(args.output, name)
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    # With --seed every image gets its own fixed noise, independent of worker scheduling
+    noise = NoiseEngine.for_key(args.seed, path) if args.seed is not None else None
+
+    if isinstance(image, np.memmap):
+        if args.portrait:
+            raise ValueError("portrait mode needs the whole image in memory; convert mapped inputs to PNG")
+        noisy, processed, output_path = process_mapped(processor, path, base, args, noise)
+        # Exact SSIM would need several float64 copies of the whole image
+        fast, fast_options = True, dict(downsample="auto")
+    else:
+        noisy = processor.make_noisy(image, args.noise, sigma=args.sigma, sp_amount=args.sp_amount, noise=noise)
+        source = noisy if noisy is not None else image
+        if args.portrait:
+            processed = processor.run_portrait(source, args.filter, workers=args.tile_workers)
+        else:
+            processed = processor.run_filter(source, args.filter, workers=args.tile_workers)
+        suffix = "_portrait" if args.portrait else ""
+        output_path = f"{base}_{filter_slug(args.filter)}{suffix}.png"
+        fast, fast_options = args.fast_ssim, dict(downsample=args.ssim_downsample) if args.fast_ssim else {}
+
+    if not args.no_metrics:
+        if noisy is not None:
+            record["psnr_noisy"], record["ssim_noisy"] = processor.compute_metrics(image, noisy, fast, **fast_options)
+        record["psnr"], record["ssim"] = processor.compute_metrics(image, processed, fast, **fast_options)
+        # Exact and fast (especially downsampled) SSIM differ a lot, so say which one each row used
+        record["ssim_method"] = f"fast downsample={fast_options['downsample']}" if fast else "exact"
+
+    if not isinstance(image, np.memmap):
+        storage.write_image(output_path, processed)
+        if args.save_noisy and noisy is not None:
+            storage.write_image(f"{base}_noisy.png", noisy)
+    elif noisy is not None and not args.save_noisy:
+        noisy_path = noisy.filename
+        del noisy
+        os.remove(noisy_path)
+    record["output"] = output_path
+
+    record["seconds"] = round(time.perf_counter() - start, 4)
+    return record
+
+
+def process_mapped(processor, path, base, args, noise=None):
+    """Streams a mapped image through noise and filter into mapped files named base_<suffix>.
+
+    Returns (noisy map or None, filtered map, output path). Outputs keep the
+    input's format (.npy or .tif).
+    """
+    ext = os.path.splitext(path)[1]
+    noisy = None
+    source_path = path
+    if args.noise != "None":
+        source_path = f"{base}_noisy{ext}"
+        noisy = processor.noise_file(path, source_path, args.noise, sigma=args.sigma, sp_amount=args.sp_amount, noise=noise)
+    output_path = f"{base}_{filter_slug(args.filter)}{ext}"
+    processed = processor.filter_file(source_path, output_path, args.filter, workers=args.tile_workers)
+    return noisy, processed, output_path
+
+
+def run_batch(args):
+    """Streams every input image through the pipeline; returns (processed count, failure count)."""
+    os.makedirs(args.output, exist_ok=True)
+    processor = ImageProcessor(cache=ResultCache(disk_dir=args.cache_dir) if args.cache_dir else None,
+                               entropy_selection=args.entropy_selection)
+    report = ReportWriter(args.report)
+    pending = queue.Queue(maxsize=args.prefetch)
+    done = object()
+    counts = {"ok": 0, "failed": 0}
+    counts_lock = threading.Lock()
+
+    def load_images():
+        owners = {}  # output name -> first input path writing it
+        try:
+            for path, name in iter_image_paths(args.inputs):
+                owner = owners.get(os.path.normcase(name))
+                if owner is not None:
+                    # e.g. x.jpg next to x.png, or an input listed twice
+                    pending.put((path, name, None, f"output name {name!r} is already used by {owner}"))
+                    continue
+                owners[os.path.normcase(name)] = path
+                # Decoded to RGB in memory, or mapped (not read) for .npy/.tif
+                try:
+                    image = storage.read_image(path)
+                except (OSError, ValueError):
+                    image = None
+                pending.put((path, name, image, None if image is not None else "could not read image"))
+        finally:
+            for _ in range(args.workers):
+                pending.put(done)
+
+    def work():
+        while True:
+            item = pending.get()
+            if item is done:
+                return
+            path, name, image, error = item
+            try:
+                if error is not None:
+                    raise IOError(error)
+                with tracing.span("process_image", cat="batch", path=path):
+                    record = process_image(processor, path, name, image, args)
+                ok = True
+            except Exception as exc:
+                record = dict.fromkeys(REPORT_FIELDS)
+                record.update(path=path, filter=args.filter, noise=args.noise, error=str(exc))
+                ok = False
+            report.write(record)
+            with counts_lock:
+                counts["ok" if ok else "failed"] += 1
+            status = f"PSNR {record['psnr']:.2f} dB" if record.get("psnr") is not None else record.get("error") or "done"
+            print(f"{os.path.basename(path)}: {status}")
+
+    loader = threading.Thread(target=load_images, daemon=True)
+    loader.start()
+    workers = [threading.Thread(target=work) for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    loader.join()
+    report.close()
+    return counts["ok"], counts["failed"]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Apply a workbench filter to many images without the GUI.")
+    parser.add_argument("inputs", nargs="+", help="image directories, glob patterns or .txt/.lst list files")
+    parser.add_argument("--filter", default=ImageProcessor.FILTER_OPTIONS[0], choices=ImageProcessor.FILTER_OPTIONS)
+    parser.add_argument("--entropy-selection", default="channel", choices=ImageProcessor.ENTROPY_SELECTIONS,
+                        help="entropy Kuwahara on color: per-channel quadrants, or one shared by luminance or summed entropy")
+    parser.add_argument("--portrait", action="store_true", help="filter only the background around the GrabCut foreground")
+    parser.add_argument("--noise", default="None", choices=ImageProcessor.NOISE_OPTIONS)
+    parser.add_argument("--sigma", type=float, default=25.0, help="Gaussian noise sigma")
+    parser.add_argument("--sp-amount", type=float, default=0.02, help="salt & pepper amount")
+    parser.add_argument("--seed", type=int, help="derive a fixed noise seed per image from this and its path")
+    parser.add_argument("--output", default=os.path.join("outputs", "batch"), help="output directory")
+    parser.add_argument("--save-noisy", action="store_true", help="also save the noisy input")
+    parser.add_argument("--report", help="metrics report path (.jsonl or .csv)")
+    parser.add_argument("--no-metrics", action="store_true", help="skip PSNR/SSIM")
+    parser.add_argument("--fast-ssim", action="store_true", help="float32 Gaussian SSIM instead of scikit-image's")
+    parser.add_argument("--ssim-downsample", type=lambda v: v if v == "auto" else int(v), default=1,
+                        help="downsample factor for --fast-ssim, or 'auto'")
+    parser.add_argument("--cache-dir", help="reuse filter outputs and metrics from earlier runs stored here")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="images processed in parallel")
+    parser.add_argument("--tile-workers", type=int, default=1, help="threads per image for tiled filtering")
+    parser.add_argument("--prefetch", type=int, default=4, help="decoded images buffered ahead of the workers")
+    parser.add_argument("--trace", metavar="PATH", help="record per-stage spans and write them as Chrome-trace JSON")
+    parser.add_argument("--trace-memory", action="store_true", help="with --trace, also record bytes allocated per span")
+    args = parser.parse_args(argv)
+    if args.seed is not None and args.seed < 0:
+        parser.error("--seed must be at least 0")
+    if args.workers < 1 or args.tile_workers < 1 or args.prefetch < 1:
+        parser.error("--workers, --tile-workers and --prefetch must be at least 1")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.trace:
+        tracing.enable(memory=args.trace_memory)
+    start = time.perf_counter()
+    ok, failed = run_batch(args)
+    print(f"\nProcessed {ok} image(s), {failed} failed, in {time.perf_counter() - start:.1f}s.")
+    if args.trace:
+        print(f"Wrote {tracing.export_chrome_trace(args.trace)} span(s) to {args.trace}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,295 @@
+# bench.py
+"""Benchmarks with regression gates for the filters, noise models and metrics.
+
+Every case runs headless on deterministic synthetic images (fixed seed) of
+the requested sizes and records wall time, peak resident memory and, where
+it applies, PSNR/SSIM against the clean image. Results go to a JSON file;
+given a baseline recorded earlier on the same machine, the run fails when a
+case gets slower, uses more memory or loses quality beyond the thresholds.
+Startup cases time a fresh interpreter importing each module, since import
+cost dominates short batch jobs.
+
+Example:
+    python bench.py --sizes 0.5 2 --save-baseline benchmarks/baseline.json
+    python bench.py --sizes 0.5 2 --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import ctypes
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+import metrics
+from processor import ImageProcessor
+from noise import NoiseEngine
+
+DEFAULT_SIZES = [0.5, 2, 8, 24]
+DEFAULT_BASELINE = os.path.join("benchmarks", "baseline.json")
+# Differences below these are timer and allocator noise, not regressions
+MIN_SECONDS_DELTA = 0.02
+MIN_MEMORY_DELTA_MB = 16
+# Cases this slow run once; their timer noise is small next to the gate
+LONG_CASE_SECONDS = 5.0
+# Modules the startup cases import, each in a fresh interpreter
+STARTUP_MODULES = ["filters", "noise", "metrics", "processor", "batch", "gui"]
+
+
+def synthetic_image(megapixels, seed=0):
+    """Returns a deterministic 4:3 RGB image with smooth gradients, hard-edged shapes and fine grain.
+
+    The layout is drawn in relative coordinates, so every size shows the same scene.
+    """
+    height = int(round(np.sqrt(megapixels * 1e6 * 3 / 4)))
+    width = int(round(height * 4 / 3))
+    rng = np.random.default_rng(seed)
+
+    coarse = rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)
+    image = cv2.resize(coarse, (width, height), interpolation=cv2.INTER_CUBIC)
+    for _ in range(24):
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        x0, x1 = sorted(rng.uniform(0, width, 2).astype(int))
+        y0, y1 = sorted(rng.uniform(0, height, 2).astype(int))
+        if rng.random() < 0.5:
+            cv2.rectangle(image, (x0, y0), (x1, y1), color, thickness=-1)
+        else:
+            radius = max(1, (x1 - x0) // 4)
+            cv2.circle(image, ((x0 + x1) // 2, (y0 + y1) // 2), radius, color, thickness=-1, lineType=cv2.LINE_AA)
+
+    grain = rng.integers(-6, 7, (height, width, 1), dtype=np.int16)
+    return np.clip(image + grain, 0, 255).astype(np.uint8)
+
+
+class PeakMemory:
+    """Context manager measuring peak memory above the level at entry, in MB.
+
+    Samples the resident set size from /proc on a background thread. Where
+    /proc is missing it falls back to tracemalloc, which only sees Python and
+    NumPy allocations; `source` records which one was used.
+    """
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.source = "rss" if os.path.exists("/proc/self/statm") else "tracemalloc"
+        self._libc = None
+        if self.source == "rss":
+            try:
+                self._libc = ctypes.CDLL("libc.so.6")
+            except OSError:
+                pass
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _rss(self):
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._peak = max(self._peak, self._rss())
+
+    def __enter__(self):
+        gc.collect()
+        if self.source == "rss":
+            if self._libc is not None:
+                # Hand memory freed by earlier cases back to the OS, or reusing it would hide this case's peak
+                self._libc.malloc_trim(0)
+            self._start = self._peak = self._rss()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        else:
+            tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.source == "rss":
+            self._stop.set()
+            self._thread.join()
+            self._peak = max(self._peak, self._rss())
+            self.peak_mb = (self._peak - self._start) / 2**20
+        else:
+            self.peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+        return False
+
+
+def quality(reference, image):
+    """PSNR and fast SSIM; the exact SSIM is too slow and memory-hungry at 24 MP to run for every case."""
+    return metrics.psnr(reference, image), metrics.fast_ssim(reference, image)
+
+
+def bench_cases(processor, clean, noisy, seed):
+    """Yields (kind, name, callable returning an image or a number) for one image size."""
+    def noise(choice):
+        # A fresh engine per run, so every run draws the same noise
+        return lambda: processor.make_noisy(clean, choice, noise=NoiseEngine(seed))
+
+    for choice in ("Gaussian", "Salt & Pepper", "Both"):
+        yield "noise", choice, noise(choice)
+    for name in ImageProcessor.FILTER_OPTIONS:
+        func, params, _ = processor._filter_plan(name)
+        yield "filter", name, lambda func=func, params=params: func(noisy, **params)
+    # Segmentation plus background-only filtering; no cache, so every run segments again
+    yield "portrait", "Guided Filter", lambda: processor.run_portrait(noisy, "Guided Filter")
+    yield "metric", "psnr", lambda: metrics.psnr(clean, noisy)
+    yield "metric", "ssim", lambda: metrics.ssim(clean, noisy)
+    yield "metric", "fast_ssim", lambda: metrics.fast_ssim(clean, noisy)
+
+
+def startup_cases():
+    """Yields ("startup", name, callable) for a bare interpreter and for importing each module in a fresh one.
+
+    Each callable returns how many modules the import left loaded, so a new
+    eager import shows up in the results even when it is quick.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    def run(statement):
+        result = subprocess.run([sys.executable, "-c", f"import sys; {statement}; print(len(sys.modules))"],
+                                cwd=here, check=True, capture_output=True, text=True)
+        return int(result.stdout.split()[-1])
+
+    yield "startup", "python", lambda: run("pass")
+    for module in STARTUP_MODULES:
+        yield "startup", module, lambda module=module: run(f"import {module}")
+
+
+def run_case(func, repeat):
+    """Returns (result of the first run, best wall time over up to repeat runs, peak memory of the first run)."""
+    with PeakMemory() as memory:
+        start = time.perf_counter()
+        result = func()
+        best = time.perf_counter() - start
+    for _ in range(repeat - 1 if best < LONG_CASE_SECONDS else 0):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return result, best, memory
+
+
+def run_benchmarks(args):
+    """Runs every selected case at every size; returns the results keyed by "kind:name@sizeMP"."""
+    processor = ImageProcessor()
+    results = {}
+    print("\nStartup")
+    for kind, name, func in startup_cases():
+        key = f"{kind}:{name}"
+        if args.only and not any(pattern.lower() in key.lower() for pattern in args.only):
+            continue
+        modules, seconds, _ = run_case(func, args.repeat)
+        results[key] = record = dict(kind=kind, name=name, seconds=round(seconds, 4), modules=modules,
+                                     peak_mb=0.0, memory_source="subprocess")
+        print(f"  {key:<40} {seconds:8.3f}s {record['modules']:6d} modules")
+
+    for megapixels in args.sizes:
+        clean = synthetic_image(megapixels, args.seed)
+        noisy = processor.make_noisy(clean, "Gaussian", noise=NoiseEngine(args.seed))
+        print(f"\n{megapixels:g} MP ({clean.shape[1]}x{clean.shape[0]})")
+
+        for kind, name, func in bench_cases(processor, clean, noisy, args.seed):
+            key = f"{kind}:{name}@{megapixels:g}MP"
+            if args.only and not any(pattern.lower() in key.lower() for pattern in args.only):
+                continue
+            result, seconds, memory = run_case(func, args.repeat)
+            record = dict(kind=kind, name=name, megapixels=megapixels, shape=list(clean.shape),
+                          seconds=round(seconds, 4), peak_mb=round(memory.peak_mb, 1), memory_source=memory.source)
+            if isinstance(result, np.ndarray):
+                record["psnr"], record["ssim"] = (round(v, 4) for v in quality(clean, result))
+            else:
+                record["value"] = round(result, 6)
+            results[key] = record
+
+            detail = f"PSNR {record['psnr']:.2f} dB, SSIM {record['ssim']:.4f}" if "psnr" in record else f"= {record['value']:.4f}"
+            print(f"  {kind + ':' + name:<40} {seconds:8.3f}s {memory.peak_mb:9.1f} MB  {detail}")
+    return results
+
+
+def find_regressions(results, baseline, args):
+    """Returns one message per case that is slower, larger or worse than its baseline beyond the thresholds."""
+    failures = []
+    for key, base in baseline.get("results", {}).items():
+        current = results.get(key)
+        if current is None:
+            continue
+        if (current["seconds"] > base["seconds"] * (1 + args.time_threshold)
+                and current["seconds"] - base["seconds"] > MIN_SECONDS_DELTA):
+            failures.append(f"{key}: {current['seconds']:.3f}s vs baseline {base['seconds']:.3f}s")
+        if (current["memory_source"] == base.get("memory_source")
+                and current["peak_mb"] > base["peak_mb"] * (1 + args.memory_threshold)
+                and current["peak_mb"] - base["peak_mb"] > MIN_MEMORY_DELTA_MB):
+            failures.append(f"{key}: peak {current['peak_mb']:.1f} MB vs baseline {base['peak_mb']:.1f} MB")
+        if "psnr" in base and current["psnr"] < base["psnr"] - args.psnr_tolerance:
+            failures.append(f"{key}: PSNR {current['psnr']:.3f} dB vs baseline {base['psnr']:.3f} dB")
+        if "ssim" in base and current["ssim"] < base["ssim"] - args.ssim_tolerance:
+            failures.append(f"{key}: SSIM {current['ssim']:.4f} vs baseline {base['ssim']:.4f}")
+    return failures
+
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the workbench filters, noise models and metrics.")
+    parser.add_argument("--sizes", type=float, nargs="+", default=DEFAULT_SIZES, help="image sizes in megapixels")
+    parser.add_argument("--only", nargs="+", help="run only cases whose key contains one of these strings")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the fastest is reported")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the synthetic images and noise")
+    parser.add_argument("--output", default=os.path.join("outputs", "bench.json"), help="results JSON path")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to gate against")
+    parser.add_argument("--save-baseline", metavar="PATH", help="also store these results as the baseline at PATH")
+    parser.add_argument("--time-threshold", type=float, default=0.25, help="allowed relative slowdown")
+    parser.add_argument("--memory-threshold", type=float, default=0.25, help="allowed relative peak memory growth")
+    parser.add_argument("--psnr-tolerance", type=float, default=0.05, help="allowed PSNR drop in dB")
+    parser.add_argument("--ssim-tolerance", type=float, default=0.002, help="allowed SSIM drop")
+    args = parser.parse_args(argv)
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    if args.seed < 0:
+        parser.error("--seed must be at least 0")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_benchmarks(args)
+    data = dict(
+        meta=dict(python=platform.python_version(), numpy=np.__version__, opencv=cv2.__version__,
+                  machine=platform.platform(), cpus=os.cpu_count(), seed=args.seed, repeat=args.repeat,
+                  created=time.strftime("%Y-%m-%dT%H:%M:%S")),
+        results=results,
+    )
+    write_json(args.output, data)
+    print(f"\nWrote {len(results)} result(s) to {args.output}")
+
+    if args.save_baseline:
+        write_json(args.save_baseline, data)
+        print(f"Saved baseline to {args.save_baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; skipping the regression gate.")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    failures = find_regressions(results, baseline, args)
+    for failure in failures:
+        print(f"REGRESSION {failure}", file=sys.stderr)
+    print(f"{len(failures)} regression(s) against {args.baseline}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
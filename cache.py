@@ -0,0 +1,136 @@
+# cache.py
+"""Content-addressed cache for filter outputs and metrics.
+
+Entries are keyed by a digest of the source pixels plus the operation name and
+its parameters, so re-running a filter on an unchanged image is a lookup. The
+in-memory tier is bounded by a byte budget with LRU eviction; an optional disk
+tier keeps results across runs.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+
+def _entry_size(value):
+    return value.nbytes if isinstance(value, np.ndarray) else 64
+
+
+class ResultCache:
+    """Thread-safe LRU cache of arrays and small values, with an optional disk tier."""
+
+    def __init__(self, max_bytes=1 << 30, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._digests = {}
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def digest(self, array, compute=True):
+        """Returns a hex digest of an array's shape, dtype and pixels.
+
+        Digests are remembered per array object, so hashing a large image
+        happens once. Arrays must not be modified after they are hashed.
+        With compute=False only a remembered digest is returned, else None.
+        """
+        with self._lock:
+            known = self._digests.get(id(array))
+            if known is not None and known[0]() is array:
+                return known[1]
+        if not compute:
+            return None
+
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{array.shape}|{array.dtype}".encode())
+        h.update(np.ascontiguousarray(array).data)
+        digest = h.hexdigest()
+
+        with self._lock:
+            # Drop memo entries whose arrays are gone
+            self._digests = {k: v for k, v in self._digests.items() if v[0]() is not None}
+            self._digests[id(array)] = (weakref.ref(array), digest)
+        return digest
+
+    def key(self, digest, name, params=None):
+        """Builds a cache key from a source digest, an operation name and its parameters."""
+        text = json.dumps([digest, name, params or {}], sort_keys=True, default=str)
+        return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+    def get(self, key):
+        """Returns the cached value for key, or None. Promotes disk hits into memory."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        value = self._read_disk(key)
+        if value is not None:
+            self._store(key, value)
+        return value
+
+    def put(self, key, value):
+        """Caches an array or a JSON-serializable value (e.g. a metrics tuple)."""
+        if isinstance(value, np.ndarray):
+            # Cached arrays are shared with callers, so guard them against edits
+            value.setflags(write=False)
+        self._store(key, value)
+        self._write_disk(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def _store(self, key, value):
+        size = _entry_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                old = self._entries.pop(key)
+                self.nbytes -= _entry_size(old)
+            self._entries[key] = value
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= _entry_size(evicted)
+
+    def _disk_path(self, key, ext):
+        return os.path.join(self.disk_dir, key + ext)
+
+    def _write_disk(self, key, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key, ".npy" if isinstance(value, np.ndarray) else ".json")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if isinstance(value, np.ndarray):
+            with open(tmp_path, "wb") as f:
+                np.save(f, value)
+        else:
+            with open(tmp_path, "w") as f:
+                json.dump(value, f)
+        # Rename last so concurrent readers never see a partial file
+        os.replace(tmp_path, path)
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key, ".npy")
+        if os.path.exists(path):
+            value = np.load(path, allow_pickle=False)
+            value.setflags(write=False)
+            return value
+        path = self._disk_path(key, ".json")
+        if os.path.exists(path):
+            with open(path) as f:
+                value = json.load(f)
+            return tuple(value) if isinstance(value, list) else value
+        return None
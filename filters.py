@@ -0,0 +1,316 @@
+# filters.py
+"""Filter kernels: guided, rolling guidance, Kuwahara (classic and generalized) and entropy-based Kuwahara.
+
+Every filter takes a uint8 image (grayscale or RGB) plus its parameters and
+returns a new uint8 image; ImageProcessor runs them tiled, cached and
+cancellable. This module loads only NumPy and OpenCV. SciPy, which takes
+longer to import than both together, is imported by the kernels that need
+it on first use.
+"""
+
+import cv2
+import numpy as np
+
+import tracing
+
+
+def quantize(image, bins=64):
+    """Bin indices of a [0, 1] float image, as used by the entropy maps."""
+    return np.floor(image * (bins - 1)).astype(np.intp)
+
+
+def local_entropy(image, window_size=5, bins=64):
+    """Compute local entropy map with a single sliding-window histogram sweep.
+
+    image holds [0, 1] floats, or bin indices from quantize when the
+    same quantization is shared across several window sizes.
+    """
+    quantized = image if np.issubdtype(image.dtype, np.integer) else quantize(image, bins)
+
+    # Sweep along the shorter axis so the Python loop stays short
+    transposed = image.shape[1] > image.shape[0]
+    if transposed:
+        quantized = quantized.T
+    h, w = quantized.shape
+
+    # Same window placement and 'reflect' border as scipy's uniform_filter
+    before = window_size // 2
+    after = window_size - 1 - before
+    padded = np.pad(quantized, ((before, after), (before, after)), mode='symmetric')
+
+    # With counts c_b in a window of n pixels:
+    #   H = log2(n) - sum_b(c_b * log2(c_b)) / n
+    # so only the running sum of c*log2(c) has to be tracked, and it changes
+    # by a table lookup whenever a single count goes up or down by one.
+    n = window_size * window_size
+    c = np.arange(n + 1, dtype=np.float64)
+    c_log_c = np.zeros(n + 1)
+    c_log_c[1:] = c[1:] * np.log2(c[1:])
+    # Snap the table to multiples of 2**-40 so the float64 running sum is
+    # exact; the result then does not depend on where a sweep starts.
+    c_log_c = np.round(c_log_c * 2.0**40) / 2.0**40
+    gain_on_add = np.diff(c_log_c)                                  # indexed by old count
+    gain_on_remove = np.concatenate(([0.0], -gain_on_add))          # indexed by old count
+
+    # One histogram row per output row; flat indexing avoids 2D fancy indexing
+    counts = np.zeros(h * bins, dtype=np.intp)
+    row_offsets = np.arange(h) * bins
+    running = np.zeros(h)
+
+    def update(col, gain, step):
+        for dy in range(window_size):
+            idx = row_offsets + padded[dy:dy + h, col]
+            old = counts[idx]
+            np.add(running, gain[old], out=running)
+            counts[idx] = old + step
+
+    for dx in range(window_size):
+        update(dx, gain_on_add, 1)
+
+    entropy_map = np.empty((h, w), dtype=np.float32)
+    entropy_map[:, 0] = running
+    for x in range(1, w):
+        # Slide the window one column: drop the leftmost, add the new rightmost
+        update(x - 1, gain_on_remove, -1)
+        update(x - 1 + window_size, gain_on_add, 1)
+        entropy_map[:, x] = running
+
+    entropy_map *= -1.0 / n
+    entropy_map += np.log2(n)
+    # Clamp tiny negative round-off in perfectly uniform windows
+    np.maximum(entropy_map, 0, out=entropy_map)
+    return entropy_map.T if transposed else entropy_map
+
+
+def _quadrant_views(stat_map, window_size, shape):
+    """Returns TL, TR, BL and BR views of a centered statistic computed over a padded image."""
+    h, w = shape[:2]
+    reach = window_size - 1
+    # A window whose top-left corner is at image row r is centered at
+    # padded row r + reach + window_size // 2.
+    center = window_size // 2
+    offsets = [(0, 0), (0, reach), (reach, 0), (reach, reach)]  # TL, TR, BL, BR
+    return [stat_map[center + dy:center + dy + h, center + dx:center + dx + w]
+            for dy, dx in offsets]
+
+
+def _pad_for_quadrants(image, window_size):
+    reach = window_size - 1
+    pad_width = ((reach, reach), (reach, reach)) + ((0, 0),) * (image.ndim - 2)
+    return np.pad(image, pad_width, mode='symmetric')
+
+
+def _quadrant_means(image, window_size=5):
+    """Returns mean views for the four quadrants of every pixel (grayscale or (H, W, C))."""
+    from scipy.ndimage import uniform_filter
+
+    padded = _pad_for_quadrants(image, window_size)
+    size = (window_size, window_size) + (1,) * (image.ndim - 2)
+    return _quadrant_views(uniform_filter(padded, size), window_size, image.shape)
+
+
+def _quadrant_entropies(image, window_size=5, bins=64):
+    """Returns entropy views for the four quadrants of every pixel (grayscale or (H, W, C))."""
+    padded = _pad_for_quadrants(image, window_size)
+    if padded.ndim == 2:
+        entropy_map = local_entropy(padded, window_size, bins)
+    else:
+        # Stack the channels vertically so a single sweep covers all of them.
+        # Every window read back lies inside one channel's padded block.
+        hp, wp, c = padded.shape
+        stacked = np.ascontiguousarray(padded.transpose(2, 0, 1)).reshape(c * hp, wp)
+        entropy_map = local_entropy(stacked, window_size, bins).reshape(c, hp, wp).transpose(1, 2, 0)
+    return _quadrant_views(entropy_map, window_size, image.shape)
+
+
+def _select_min_quadrant(means, criteria, out):
+    """Writes the mean of the quadrant with the lowest criterion into out (first one wins ties).
+
+    criteria may drop the channel axis, in which case every channel follows
+    the same quadrant.
+    """
+    np.copyto(out, means[0])
+    best = criteria[0].copy()
+    for mean, criterion in zip(means[1:], criteria[1:]):
+        better = criterion < best
+        np.copyto(best, criterion, where=better)
+        np.copyto(out, mean, where=better if better.ndim == out.ndim else better[..., None])
+    return out
+
+
+def kuwahara_entropy_filter(image, window_size=5, bins=64, selection="channel", quantized=None):
+    """Apply entropy-based Kuwahara filter to a grayscale or RGB image.
+
+    selection decides which entropy picks the quadrant:
+      "channel"   - each channel picks its own quadrant
+      "luminance" - all channels follow the luminance entropy
+      "sum"       - all channels follow the summed channel entropy
+    The shared modes avoid color fringing where channels disagree.
+    quantized optionally passes quantize(image / 255, bins) computed once
+    for several window sizes ("channel" and "sum" selection).
+    """
+    # Convert to float for processing
+    img_float = image.astype(np.float32)
+    img_float /= 255.0
+
+    with tracing.span("quadrant means", cat="stage"):
+        means = _quadrant_means(img_float, window_size)
+    with tracing.span("quadrant entropies", cat="stage"):
+        channels = img_float if quantized is None else quantized
+        if selection == "channel" or img_float.ndim == 2:
+            criteria = _quadrant_entropies(channels, window_size, bins)
+        elif selection == "luminance":
+            luminance = 0.299 * img_float[..., 0] + 0.587 * img_float[..., 1] + 0.114 * img_float[..., 2]
+            criteria = _quadrant_entropies(luminance, window_size, bins)
+        elif selection == "sum":
+            criteria = [e.sum(axis=2) for e in _quadrant_entropies(channels, window_size, bins)]
+        else:
+            raise ValueError(f"Unknown quadrant selection: {selection!r}")
+
+    with tracing.span("select quadrant", cat="stage"):
+        result = _select_min_quadrant(means, criteria, np.empty_like(img_float))
+
+    # Convert back to uint8
+    np.multiply(result, 255, out=result)
+    np.clip(result, 0, 255, out=result)
+    return result.astype(np.uint8)
+
+
+def guided_filter(image, radius=10, eps=4000):
+    return cv2.ximgproc.guidedFilter(guide=image, src=image, radius=radius, eps=eps)
+
+
+def rolling_guidance_filter(image, sigmaSpace=10, sigmaColor=30, numOfIter=4):
+    return cv2.ximgproc.rollingGuidanceFilter(image, sigmaSpace=sigmaSpace, sigmaColor=sigmaColor, numOfIter=numOfIter)
+
+
+def kuwahara_filter(image, kernel_size=11, mode="classic", sectors=8, q=8):
+    """Applies a Kuwahara filter that streams over the quadrants, keeping only running buffers.
+
+    kernel_size may be an int or a (height, width) pair. mode="generalized"
+    uses Papari et al.'s sector-based variant: `sectors` Gaussian-weighted
+    sectors blended with weights 1 / (1 + (var / 255) ** (q / 2)) instead
+    of taking the single lowest-variance quadrant.
+    """
+    if mode == "generalized":
+        return _generalized_kuwahara(image, kernel_size, sectors, q)
+
+    ky, kx = (kernel_size, kernel_size) if np.isscalar(kernel_size) else kernel_size
+    ry, rx = (ky - 1) // 2, (kx - 1) // 2
+    q_kernel_size = (rx + 1, ry + 1)  # OpenCV sizes and anchors are (x, y)
+    anchors = [(rx, ry), (0, ry), (rx, 0), (0, 0)]  # TL, TR, BL, BR
+
+    # Box means straight from uint8, so no float copy or squared image is made
+    mean = np.empty(image.shape, dtype=np.float32)
+    sq_mean = np.empty_like(mean)
+
+    def quadrants():
+        for anchor in anchors:
+            with tracing.span("quadrant means", cat="stage"):
+                cv2.boxFilter(image, cv2.CV_32F, q_kernel_size, dst=mean, anchor=anchor, normalize=True, borderType=cv2.BORDER_REFLECT)
+                cv2.sqrBoxFilter(image, cv2.CV_32F, q_kernel_size, dst=sq_mean, anchor=anchor, normalize=True, borderType=cv2.BORDER_REFLECT)
+            yield mean, sq_mean
+
+    return min_variance_quadrant(quadrants(), image.shape)
+
+
+def min_variance_quadrant(quadrants, shape):
+    """Rounds the mean of the lowest-variance quadrant of every pixel into a uint8 image.
+
+    quadrants yields float32 (mean, mean of squares) pairs, TL, TR, BL and
+    BR, and may reuse its buffers between pairs.
+    """
+    best_mean = np.empty(shape, dtype=np.float32)
+    variance = np.empty(shape[:2], dtype=np.float32)
+    best_variance = np.empty_like(variance)
+    term = np.empty_like(variance)
+    better = np.empty(shape[:2], dtype=bool)
+
+    for i, (mean, sq_mean) in enumerate(quadrants):
+        # Keep a running minimum; the first quadrant wins ties, as argmin did
+        with tracing.span("select quadrant", cat="stage"):
+            _summed_variance(mean, sq_mean, variance, term)
+            if i == 0:
+                np.copyto(best_variance, variance)
+                np.copyto(best_mean, mean)
+            else:
+                np.less(variance, best_variance, out=better)
+                np.copyto(best_variance, variance, where=better)
+                np.copyto(best_mean, mean, where=better[..., None] if len(shape) == 3 else better)
+
+    np.rint(best_mean, out=best_mean)
+    return best_mean.astype(np.uint8)
+
+
+def _summed_variance(mean, sq_mean, out, term):
+    """Writes sum over channels of (sq_mean - mean**2) into out, using term as scratch."""
+    if mean.ndim == 2:
+        np.multiply(mean, mean, out=out)
+        np.subtract(sq_mean, out, out=out)
+        return out
+    for c in range(mean.shape[2]):
+        target = out if c == 0 else term
+        np.multiply(mean[..., c], mean[..., c], out=target)
+        np.subtract(sq_mean[..., c], target, out=target)
+        if c > 0:
+            out += term
+    return out
+
+
+def _sector_kernels(kernel_size, sectors):
+    """Returns normalized Gaussian-weighted sector kernels for the generalized Kuwahara filter."""
+    from scipy.special import erf
+
+    ky, kx = (kernel_size, kernel_size) if np.isscalar(kernel_size) else kernel_size
+    ry, rx = max((ky - 1) // 2, 1), max((kx - 1) // 2, 1)
+    y, x = np.mgrid[-ry:ry + 1, -rx:rx + 1]
+    u, v = x / rx, y / ry
+    rho2 = u * u + v * v
+    radial = np.where(rho2 <= 1.0, np.exp(-rho2 / (2 * 0.5 ** 2)), 0.0)
+
+    # Sector indicators smoothed in angle so neighbouring sectors overlap softly
+    half = np.pi / sectors
+    smooth = half / 2
+    angle = np.arctan2(v, u)
+    kernels = []
+    for i in range(sectors):
+        delta = np.angle(np.exp(1j * (angle - 2 * half * i)))
+        weight = 0.5 * (erf((delta + half) / (np.sqrt(2) * smooth)) - erf((delta - half) / (np.sqrt(2) * smooth)))
+        weight[ry, rx] = 1.0 / sectors  # the center belongs to every sector
+        kernel = (weight * radial).astype(np.float32)
+        kernels.append(kernel / kernel.sum())
+    return kernels
+
+
+def _generalized_kuwahara(image, kernel_size=11, sectors=8, q=8):
+    """Sector-based generalized Kuwahara filter, accumulated one sector at a time."""
+    sq_image = np.square(image, dtype=np.float32)
+    mean = np.empty(image.shape, dtype=np.float32)
+    sq_mean = np.empty_like(mean)
+    weighted = np.zeros_like(mean)
+    weight = np.empty(image.shape[:2], dtype=np.float32)
+    total_weight = np.zeros_like(weight)
+    term = np.empty_like(weight)
+
+    for kernel in _sector_kernels(kernel_size, sectors):
+        with tracing.span("sector means", cat="stage"):
+            cv2.filter2D(image, cv2.CV_32F, kernel, dst=mean, borderType=cv2.BORDER_REFLECT)
+            cv2.filter2D(sq_image, cv2.CV_32F, kernel, dst=sq_mean, borderType=cv2.BORDER_REFLECT)
+            _summed_variance(mean, sq_mean, weight, term)
+
+        # weight = 1 / (1 + (variance / 255) ** (q / 2))
+        with tracing.span("sector weights", cat="stage"):
+            np.maximum(weight, 0, out=weight)
+            weight *= 1.0 / 255.0
+            np.power(weight, q / 2, out=weight)
+            weight += 1.0
+            np.reciprocal(weight, out=weight)
+
+            total_weight += weight
+            mean *= weight[..., None] if image.ndim == 3 else weight
+            weighted += mean
+
+    weighted /= total_weight[..., None] if image.ndim == 3 else total_weight
+    np.rint(weighted, out=weighted)
+    np.clip(weighted, 0, 255, out=weighted)
+    return weighted.astype(np.uint8)
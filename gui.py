@@ -0,0 +1,774 @@
+# gui.py
+"""Tk front end of the workbench. Start it with `python app.py`, which shows the window before this loads."""
+
+import os
+import queue
+import threading
+import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import filedialog, ttk
+
+import cv2
+from PIL import Image, ImageTk
+
+import storage
+import tracing
+from cache import ResultCache
+from noise import NoiseEngine
+from processor import ImageProcessor, JobCancelled
+
+
+class DisplayPyramid:
+    """Area-downscaled copies of one image for canvas rendering, built lazily and kept until the image changes."""
+
+    def __init__(self, image):
+        self.image = image
+        self.levels = [image]
+        self._rendered = None  # ((width, height), PhotoImage) of the last render
+
+    def level_for(self, width, height):
+        """Returns the smallest level that is still at least width x height."""
+        while True:
+            last = self.levels[-1]
+            h, w = last.shape[:2]
+            if w // 2 < width or h // 2 < height:
+                break
+            self.levels.append(cv2.resize(last, (w // 2, h // 2), interpolation=cv2.INTER_AREA))
+        for level in reversed(self.levels):
+            if level.shape[1] >= width and level.shape[0] >= height:
+                return level
+        return self.levels[0]
+
+    def photo(self, width, height):
+        """Returns a PhotoImage of the image at exactly width x height, reusing the last one if the size matches."""
+        if self._rendered is not None and self._rendered[0] == (width, height):
+            return self._rendered[1]
+        level = self.level_for(width, height)
+        if level.shape[:2] != (height, width):
+            level = cv2.resize(level, (width, height), interpolation=cv2.INTER_AREA)
+        photo = ImageTk.PhotoImage(image=Image.fromarray(level))
+        self._rendered = ((width, height), photo)
+        return photo
+
+
+class ImageFilterApp(ImageProcessor):
+    def __init__(self, root):
+        super().__init__(cache=ResultCache())
+        self.root = root
+        self.root.title("Image Filter Workbench")
+        self.root.geometry("1200x800")
+
+        # --- Image Storage ---
+        self.original_image = None
+        self.processed_image = None
+        self.noisy_image = None
+        self.noisy_metrics = None  # (PSNR, SSIM) of noisy_image, computed once per noise event
+        self.image_path = None
+
+        # --- Background Jobs ---
+        # Filtering and noise run on one worker thread; results come back through
+        # ui_queue, which is drained on the Tk thread by _poll_jobs.
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.ui_queue = queue.Queue()
+        self.job_id = 0
+        self.job_cancel = None
+        self._polling = False
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # --- Display State ---
+        self._pyramids = {}        # id(image) -> DisplayPyramid
+        self._canvas_pyramid = {}  # canvas -> DisplayPyramid currently shown
+        self._redraw_after = None
+
+        # --- GUI Layout ---
+        control_frame = tk.Frame(root, pady=10)
+        control_frame.pack(side=tk.TOP, fill=tk.X)
+
+        image_frame = tk.Frame(root, padx=10, pady=10)
+        image_frame.pack(side=tk.TOP, expand=True, fill=tk.BOTH)
+
+        # --- Image Canvases ---
+        # Left frame for original image
+        left_frame = tk.Frame(image_frame)
+        left_frame.pack(side=tk.LEFT, expand=True, fill=tk.BOTH, padx=5)
+        tk.Label(left_frame, text="Original Image", bg="#34495e", fg="white", font=("Arial", 11, "bold"), pady=5).pack(side=tk.TOP, fill=tk.X)
+        self.canvas_original = tk.Canvas(left_frame, bg="#2c3e50", highlightthickness=0)
+        self.canvas_original.pack(side=tk.TOP, expand=True, fill=tk.BOTH)
+
+        # Right frame for processed image
+        right_frame = tk.Frame(image_frame)
+        right_frame.pack(side=tk.RIGHT, expand=True, fill=tk.BOTH, padx=5)
+        tk.Label(right_frame, text="Processed Image", bg="#34495e", fg="white", font=("Arial", 11, "bold"), pady=5).pack(side=tk.TOP, fill=tk.X)
+        self.canvas_processed = tk.Canvas(right_frame, bg="#2c3e50", highlightthickness=0)
+        self.canvas_processed.pack(side=tk.TOP, expand=True, fill=tk.BOTH)
+
+        # Redraw on resize, throttled so dragging the window edge stays smooth
+        self.canvas_original.bind("<Configure>", self._on_canvas_resize)
+        self.canvas_processed.bind("<Configure>", self._on_canvas_resize)
+
+        # --- Controls ---
+        btn_load = tk.Button(control_frame, text="Load Image", command=self.load_image)
+        btn_load.pack(side=tk.LEFT, padx=10)
+
+        self.filter_options = list(self.FILTER_OPTIONS)
+        self.selected_filter = tk.StringVar(value=self.filter_options[0])
+        filter_menu = ttk.Combobox(control_frame, textvariable=self.selected_filter, values=self.filter_options, state="readonly", width=25)
+        filter_menu.pack(side=tk.LEFT, padx=10)
+
+        # --- NEW --- Bind the on_filter_change function to the combobox selection event
+        filter_menu.bind("<<ComboboxSelected>>", self.on_filter_change)
+
+        # Entropy Kuwahara on color images: per-channel quadrants, or one shared quadrant to avoid fringing
+        tk.Label(control_frame, text="Entropy colors:").pack(side=tk.LEFT)
+        self.entropy_selection_var = tk.StringVar(value=self.entropy_selection)
+        selection_menu = ttk.Combobox(control_frame, textvariable=self.entropy_selection_var,
+                                      values=self.ENTROPY_SELECTIONS, state="readonly", width=9)
+        selection_menu.pack(side=tk.LEFT, padx=(2, 10))
+        selection_menu.bind("<<ComboboxSelected>>", self.on_entropy_selection_change)
+
+        btn_apply = tk.Button(control_frame, text="Apply Filter", command=self.apply_filter)
+        btn_apply.pack(side=tk.LEFT, padx=10)
+
+        # Runs every filter on the same source at once and opens a results grid
+        btn_compare = tk.Button(control_frame, text="Compare All", command=self.compare_all)
+        btn_compare.pack(side=tk.LEFT, padx=(0, 10))
+        self.compare_window = None
+
+        # Preview: run the filter on a canvas-sized proxy instead of the full image
+        self.preview_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(control_frame, text="Preview", variable=self.preview_var).pack(side=tk.LEFT)
+
+        # Portrait: filter only the background around the GrabCut foreground
+        self.portrait_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(control_frame, text="Portrait", variable=self.portrait_var).pack(side=tk.LEFT)
+
+        self.btn_cancel = tk.Button(control_frame, text="Cancel", command=self.cancel_job, state=tk.DISABLED)
+        self.btn_cancel.pack(side=tk.LEFT, padx=(0, 6))
+
+        self.progress = ttk.Progressbar(control_frame, length=100, mode="determinate", maximum=1.0)
+        self.progress.pack(side=tk.LEFT, padx=(0, 10))
+
+        # Span timings per pipeline stage; recording is off until the panel enables it
+        self.profiler_window = None
+        tk.Button(control_frame, text="Profiler", command=self.open_profiler).pack(side=tk.LEFT, padx=(0, 10))
+
+        # --- Noise Controls ---
+        self.noise_options = list(self.NOISE_OPTIONS)
+        self.selected_noise = tk.StringVar(value=self.noise_options[0])
+        noise_menu = ttk.Combobox(control_frame, textvariable=self.selected_noise, values=self.noise_options, state="readonly", width=18)
+        noise_menu.pack(side=tk.LEFT, padx=10)
+
+        tk.Label(control_frame, text="Gauss sigma:").pack(side=tk.LEFT)
+        self.gauss_sigma_var = tk.DoubleVar(value=25.0)
+        gauss_entry = tk.Entry(control_frame, textvariable=self.gauss_sigma_var, width=6)
+        gauss_entry.pack(side=tk.LEFT, padx=(2, 8))
+
+        tk.Label(control_frame, text="SP amount:").pack(side=tk.LEFT)
+        self.sp_amount_var = tk.DoubleVar(value=0.02)
+        sp_entry = tk.Entry(control_frame, textvariable=self.sp_amount_var, width=6)
+        sp_entry.pack(side=tk.LEFT, padx=(2, 8))
+
+        # Blank draws fresh noise each time; a number fixes the noise for each image
+        tk.Label(control_frame, text="Seed:").pack(side=tk.LEFT)
+        self.noise_seed_var = tk.StringVar(value="")
+        tk.Entry(control_frame, textvariable=self.noise_seed_var, width=6).pack(side=tk.LEFT, padx=(2, 8))
+
+        btn_add_noise = tk.Button(control_frame, text="Add Noise", command=self.add_noise)
+        btn_add_noise.pack(side=tk.LEFT, padx=6)
+
+        btn_save_noisy = tk.Button(control_frame, text="Save Noisy", command=self.save_noisy)
+        btn_save_noisy.pack(side=tk.LEFT, padx=6)
+
+        btn_save_processed = tk.Button(control_frame, text="Save Processed", command=self.save_processed)
+        btn_save_processed.pack(side=tk.LEFT, padx=6)
+
+        # --- Metrics Display ---
+        metrics_frame = tk.Frame(control_frame)
+        metrics_frame.pack(side=tk.LEFT, padx=20)
+        
+        self.psnr_label = tk.Label(metrics_frame, text="PSNR: --", font=("Arial", 10))
+        self.psnr_label.pack(side=tk.TOP)
+        
+        self.ssim_label = tk.Label(metrics_frame, text="SSIM: --", font=("Arial", 10))
+        self.ssim_label.pack(side=tk.TOP)
+        
+        # Additional labels to show noisy metrics
+        self.psnr_noisy_label = tk.Label(metrics_frame, text="PSNR (noisy): --", font=("Arial", 9))
+        self.psnr_noisy_label.pack(side=tk.TOP)
+        self.ssim_noisy_label = tk.Label(metrics_frame, text="SSIM (noisy): --", font=("Arial", 9))
+        self.ssim_noisy_label.pack(side=tk.TOP)
+
+        # Fast SSIM: float32 Gaussian window, downsampled on large images
+        self.fast_ssim_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(metrics_frame, text="Fast SSIM", variable=self.fast_ssim_var,
+                       command=self.on_metrics_mode_change).pack(side=tk.TOP)
+    
+    # --- NEW --- This function is called when a new filter is selected from the dropdown
+    def on_filter_change(self, event=None):
+        """Clears the processed image canvas when the filter selection changes."""
+        self._invalidate_job()
+        if self.original_image is None:
+            return # Do nothing if no image is loaded
+            
+        print(f"\nFilter selection changed to '{self.selected_filter.get()}'. Clearing view.")
+        
+        # Clear the canvas (no text overlay)
+        self._clear_canvas(self.canvas_processed)
+        
+        # Reset the metrics and the stored processed image
+        self.processed_image = None
+
+        # Show the result right away if this filter already ran on this source, in the same mode
+        source = self.noisy_image if self.noisy_image is not None else self.original_image
+        lookup = self.cached_portrait_result if self.portrait_var.get() else self.cached_filter_result
+        # Only sources hashed before can have results; hashing a new one here would block the Tk thread
+        cached = lookup(source, self.selected_filter.get(), hash_image=False)
+        if cached is not None:
+            print("Showing cached result.")
+            self.processed_image = cached
+            self.display_image(self.processed_image, self.canvas_processed)
+        self._calculate_and_display_metrics()
+        if cached is None and self.preview_var.get():
+            self._apply_preview(self.selected_filter.get())
+
+    def on_entropy_selection_change(self, event=None):
+        """Switches the entropy Kuwahara quadrant selection; a shown entropy result is cleared like on a filter change."""
+        self.entropy_selection = self.entropy_selection_var.get()
+        if self.selected_filter.get() == "Kuwahara Filter (Entropy-based)":
+            self.on_filter_change()
+
+    def load_image(self):
+        """Loads an image from file and displays it."""
+        self.image_path = filedialog.askopenfilename(filetypes=[("Image Files", "*.jpg;*.jpeg;*.png;*.bmp;*.tif;*.tiff"),
+                                                                       ("Mapped Images", "*.npy;*.tif;*.tiff")])
+        if not self.image_path:
+            print("Image loading cancelled.")
+            return
+
+        self._invalidate_job()
+        # Its results belong to the old source
+        self._close_comparison()
+        print(f"Loading image from: {os.path.basename(self.image_path)}")
+        with tracing.span("load_image", cat="gui"):
+            # Decodes and turns BGR into RGB in place; .npy/.tif files are mapped instead
+            self.original_image = storage.read_image(self.image_path)
+        print("Image loaded and converted to RGB successfully.")
+
+        # Reset noisy and processed
+        self.noisy_image = None
+        self.noisy_metrics = None
+        self.processed_image = None
+
+        self.display_image(self.original_image, self.canvas_original)
+        self._clear_canvas(self.canvas_processed)
+        self._calculate_and_display_metrics() # Reset metrics on new image load
+
+    def display_image(self, image_data, canvas):
+        """Shows an image on the given canvas, scaled to fit, using the image's display pyramid."""
+        with tracing.span("display_image", cat="gui"):
+            self._canvas_pyramid[canvas] = self._pyramid_for(image_data)
+            self._render_canvas(canvas)
+
+    def _pyramid_for(self, image):
+        # Keep pyramids only for images still in use, so they are rebuilt only when an image changes
+        live = {id(a) for a in (self.original_image, self.noisy_image, self.processed_image, image) if a is not None}
+        live.update(id(p.image) for p in self._canvas_pyramid.values())
+        self._pyramids = {k: p for k, p in self._pyramids.items() if k in live}
+        pyramid = self._pyramids.get(id(image))
+        if pyramid is None or pyramid.image is not image:
+            pyramid = DisplayPyramid(image)
+            self._pyramids[id(image)] = pyramid
+        return pyramid
+
+    def _render_canvas(self, canvas):
+        canvas.delete("all")
+        pyramid = self._canvas_pyramid.get(canvas)
+        canvas_width = canvas.winfo_width()
+        canvas_height = canvas.winfo_height()
+        if pyramid is None or canvas_width <= 1 or canvas_height <= 1:
+            # Not mapped yet; the <Configure> handler draws it once it is
+            return
+
+        img_height, img_width = pyramid.image.shape[:2]
+        scale = min(canvas_width / img_width, canvas_height / img_height)
+        new_width = int(img_width * scale)
+        new_height = int(img_height * scale)
+
+        if new_width > 0 and new_height > 0:
+            with tracing.span("render_canvas", cat="gui", size=[new_width, new_height]):
+                photo = pyramid.photo(new_width, new_height)
+            canvas.create_image(canvas_width / 2, canvas_height / 2, image=photo, anchor=tk.CENTER)
+            canvas.image = photo
+
+    def _clear_canvas(self, canvas):
+        self._canvas_pyramid.pop(canvas, None)
+        canvas.delete("all")
+
+    def _on_canvas_resize(self, event=None):
+        if self._redraw_after is not None:
+            self.root.after_cancel(self._redraw_after)
+        self._redraw_after = self.root.after(100, self._redraw_canvases)
+
+    def _redraw_canvases(self):
+        self._redraw_after = None
+        for canvas in list(self._canvas_pyramid):
+            self._render_canvas(canvas)
+
+    def _apply_preview(self, choice):
+        """Runs the filter on a canvas-sized proxy of the source and shows it without committing it."""
+        source = self.noisy_image if self.noisy_image is not None else self.original_image
+        width = max(self.canvas_processed.winfo_width(), 400)
+        height = max(self.canvas_processed.winfo_height(), 300)
+        img_height, img_width = source.shape[:2]
+        scale = min(width / img_width, height / img_height, 1.0)
+        proxy = self._pyramid_for(source).level_for(int(img_width * scale), int(img_height * scale))
+        run = self.run_portrait if self.portrait_var.get() else self.run_filter
+        print(f"\nPreviewing '{choice}' at {proxy.shape[1]}x{proxy.shape[0]}...")
+
+        def done(preview):
+            self.display_image(preview, self.canvas_processed)
+            self.psnr_label.config(text="PSNR: -- (preview)")
+            self.ssim_label.config(text="SSIM: -- (preview)")
+
+        self._start_job(lambda progress, cancel: run(proxy, choice, progress=progress, cancel=cancel),
+                        done, f"Preview '{choice}'")
+
+    def apply_filter(self):
+        """Applies the selected filter to the original image in the background."""
+        if self.original_image is None:
+            print("Error: Please load an image first.")
+            return
+
+        choice = self.selected_filter.get()
+        if self.preview_var.get():
+            self._apply_preview(choice)
+            return
+        print(f"\nApplying filter: '{choice}'...")
+
+        # decide source image (noisy if present)
+        original, noisy, noisy_metrics = self.original_image, self.noisy_image, self.noisy_metrics
+        fast = self.fast_ssim_var.get()
+        source = noisy if noisy is not None else original
+        portrait = self.portrait_var.get()
+        tile_rows = self._interactive_tile_rows(source, choice)
+
+        def work(progress, cancel):
+            if portrait:
+                processed = self.run_portrait(source, choice, progress=progress, cancel=cancel)
+            else:
+                processed = self.run_filter(source, choice, tile_rows=tile_rows, progress=progress, cancel=cancel)
+            return processed, self._metric_values(original, noisy, processed, noisy_metrics, fast)
+
+        def done(result):
+            self.processed_image, values = result
+            print(f"'{choice}' filter applied successfully. Displaying result.")
+            self.display_image(self.processed_image, self.canvas_processed)
+            self._show_metrics(values)
+
+        self._start_job(work, done, f"Filter '{choice}'")
+
+    def _interactive_tile_rows(self, image, choice):
+        """Band height for GUI runs: enough bands for a smooth progress bar and a responsive Cancel.
+
+        Never thinner than a few halos of the filter, or the overlap rows
+        filtered twice would cost more than the progress is worth.
+        """
+        _, _, halo = self._filter_plan(choice)
+        bands = max(8, 2 * (os.cpu_count() or 1))
+        return max(self._min_tile_rows(halo, floor=32), -(-image.shape[0] // bands))
+
+    def compare_all(self):
+        """Runs all filters on the current source in the background and shows them side by side."""
+        if self.original_image is None:
+            print("Error: Please load an image first.")
+            return
+        print("\nComparing all filters...")
+
+        original, noisy, noisy_metrics = self.original_image, self.noisy_image, self.noisy_metrics
+        fast = self.fast_ssim_var.get()
+        fast_options = dict(downsample="auto") if fast else {}
+        source = noisy if noisy is not None else original
+        tile_rows = {name: self._interactive_tile_rows(source, name) for name in self.FILTER_OPTIONS}
+
+        def work(progress, cancel):
+            results = self.compare_filters(original, source, fast=fast, tile_rows=tile_rows,
+                                           progress=progress, cancel=cancel, **fast_options)
+            return results, self._metric_values(original, noisy, None, noisy_metrics, fast)
+
+        def done(result):
+            results, values = result
+            if noisy is not None:
+                self.noisy_metrics = (values["psnr_noisy"], values["ssim_noisy"])
+            for name, r in results.items():
+                print(f"  {name}: {r['seconds']:.2f}s, PSNR {r['psnr']:.2f} dB, SSIM {r['ssim']:.4f}")
+            self._show_comparison(results, values)
+
+        self._start_job(work, done, "Compare all")
+
+    def _show_comparison(self, results, values):
+        """Opens a window with a grid of the filter outputs and a table of their times and metrics."""
+        self._close_comparison()
+        window = tk.Toplevel(self.root)
+        window.title("Compare All Filters")
+        window.geometry("900x760")
+        window.protocol("WM_DELETE_WINDOW", self._close_comparison)
+        self.compare_window = window
+        self._compare_canvases = []
+
+        grid = tk.Frame(window)
+        grid.pack(side=tk.TOP, expand=True, fill=tk.BOTH, padx=5, pady=5)
+        for i, (name, r) in enumerate(results.items()):
+            cell = tk.Frame(grid)
+            cell.grid(row=i // 2, column=i % 2, sticky="nsew", padx=4, pady=4)
+            grid.rowconfigure(i // 2, weight=1)
+            grid.columnconfigure(i % 2, weight=1)
+            tk.Label(cell, text=name, bg="#34495e", fg="white", font=("Arial", 10, "bold")).pack(side=tk.TOP, fill=tk.X)
+            canvas = tk.Canvas(cell, bg="#2c3e50", highlightthickness=0, width=420, height=260)
+            canvas.pack(side=tk.TOP, expand=True, fill=tk.BOTH)
+            canvas.bind("<Configure>", self._on_canvas_resize)
+            self._compare_canvases.append(canvas)
+            self.display_image(r["image"], canvas)
+
+        columns = ("time", "psnr", "ssim", "gain")
+        table = ttk.Treeview(window, columns=columns, height=len(results))
+        table.heading("#0", text="Filter (select to use)")
+        table.column("#0", width=260)
+        ssim_name = "SSIM (fast)" if values["fast"] else "SSIM"
+        for column, title in zip(columns, ("Time s", "PSNR dB", ssim_name, "PSNR gain dB")):
+            table.heading(column, text=title)
+            table.column(column, width=110, anchor=tk.E)
+        for name, r in sorted(results.items(), key=lambda item: item[1]["psnr"], reverse=True):
+            gain = "--" if values["psnr_noisy"] is None else f"{r['psnr'] - values['psnr_noisy']:+.2f}"
+            table.insert("", tk.END, iid=name, text=name,
+                         values=(f"{r['seconds']:.2f}", f"{r['psnr']:.2f}", f"{r['ssim']:.4f}", gain))
+        table.pack(side=tk.TOP, fill=tk.X, padx=5, pady=(0, 5))
+        table.bind("<<TreeviewSelect>>", lambda event: self._use_comparison_result(results, values, table.selection()))
+
+    def _use_comparison_result(self, results, values, selection):
+        """Makes the selected comparison result the processed image, as if that filter had been applied."""
+        if not selection:
+            return
+        name = selection[0]
+        self._invalidate_job()
+        self.selected_filter.set(name)
+        self.processed_image = results[name]["image"]
+        self.display_image(self.processed_image, self.canvas_processed)
+        self._show_metrics(dict(values, psnr=results[name]["psnr"], ssim=results[name]["ssim"]))
+
+    def _close_comparison(self):
+        if self.compare_window is None:
+            return
+        for canvas in self._compare_canvases:
+            self._canvas_pyramid.pop(canvas, None)
+        self.compare_window.destroy()
+        self.compare_window = None
+
+    def _calculate_and_display_metrics(self):
+        """Updates the PSNR and SSIM labels, computing missing values in a background job."""
+        # if no image loaded
+        if self.original_image is None:
+            return
+        original, noisy, processed = self.original_image, self.noisy_image, self.processed_image
+        noisy_metrics, fast = self.noisy_metrics, self.fast_ssim_var.get()
+        if processed is None and (noisy is None or noisy_metrics is not None):
+            # Everything to show is known already
+            self._show_metrics(self._metric_values(original, noisy, None, noisy_metrics, fast))
+            return
+
+        if processed is not None:
+            # Until the job finishes, don't leave the previous result's values up
+            self.psnr_label.config(text="PSNR: ...")
+            self.ssim_label.config(text="SSIM: ...")
+
+        def work(progress, cancel):
+            with tracing.span("calculate_metrics", cat="gui"):
+                return self._metric_values(original, noisy, processed, noisy_metrics, fast)
+
+        def done(values):
+            if noisy is not None:
+                self.noisy_metrics = (values["psnr_noisy"], values["ssim_noisy"])
+            self._show_metrics(values)
+
+        self._start_job(work, done, "Metrics")
+
+    def _metric_values(self, original, noisy, processed, noisy_metrics=None, fast=False):
+        """Computes the values shown in the metrics panel. Safe to call off the Tk thread.
+
+        noisy_metrics, when given, are reused instead of recomputing them for noisy.
+        """
+        values = dict(psnr_noisy=None, ssim_noisy=None, psnr=None, ssim=None, fast=fast)
+        fast_options = dict(downsample="auto") if fast else {}
+        if noisy is not None:
+            if noisy_metrics is None:
+                try:
+                    noisy_metrics = self.compute_metrics(original, noisy, fast, **fast_options)
+                except Exception:
+                    noisy_metrics = (None, None)
+            values["psnr_noisy"], values["ssim_noisy"] = noisy_metrics
+        if processed is not None:
+            values["psnr"], values["ssim"] = self.compute_metrics(original, processed, fast, **fast_options)
+        return values
+
+    def on_metrics_mode_change(self):
+        """Recomputes the shown metrics after the Fast SSIM toggle changes."""
+        self.noisy_metrics = None
+        if self.job_cancel is not None:
+            # A running job picks the mode up on the next apply
+            return
+        self._calculate_and_display_metrics()
+
+    def _show_metrics(self, values):
+        """Updates the metric labels from _metric_values output."""
+        # show noisy metrics if noisy image exists
+        if values["psnr_noisy"] is not None:
+            self.psnr_noisy_label.config(text=f"PSNR (noisy): {values['psnr_noisy']:.2f} dB")
+            self.ssim_noisy_label.config(text=f"SSIM (noisy): {values['ssim_noisy']:.4f}")
+        else:
+            self.psnr_noisy_label.config(text="PSNR (noisy): --")
+            self.ssim_noisy_label.config(text="SSIM (noisy): --")
+
+        if values["psnr"] is None:
+            self.psnr_label.config(text="PSNR: --")
+            self.ssim_label.config(text="SSIM: --")
+            return
+
+        self.psnr_label.config(text=f"PSNR: {values['psnr']:.2f} dB")
+        ssim_name = "SSIM (fast)" if values["fast"] else "SSIM"
+        self.ssim_label.config(text=f"{ssim_name}: {values['ssim']:.4f}")
+        print(f"Metrics Calculated -> PSNR: {values['psnr']:.2f} dB, SSIM: {values['ssim']:.4f}")
+
+        # Also print improvement over noisy (if noisy exists)
+        if values["psnr_noisy"] is not None:
+            print(f"Improvement vs noisy -> PSNR delta: {values['psnr'] - values['psnr_noisy']:+.2f} dB")
+
+    # --- Profiling ---
+
+    def open_profiler(self):
+        """Opens the profiler panel: a rolling per-stage summary of the recorded spans."""
+        if self.profiler_window is not None:
+            self.profiler_window.lift()
+            return
+        window = tk.Toplevel(self.root)
+        window.title("Profiler")
+        window.geometry("560x360")
+        window.protocol("WM_DELETE_WINDOW", self._close_profiler)
+        self.profiler_window = window
+
+        controls = tk.Frame(window, pady=4)
+        controls.pack(side=tk.TOP, fill=tk.X)
+        self.trace_var = tk.BooleanVar(value=tracing.is_enabled())
+        self.trace_memory_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(controls, text="Record spans", variable=self.trace_var,
+                       command=self._on_tracing_toggle).pack(side=tk.LEFT, padx=6)
+        tk.Checkbutton(controls, text="Track memory", variable=self.trace_memory_var,
+                       command=self._on_tracing_toggle).pack(side=tk.LEFT)
+        tk.Button(controls, text="Clear", command=tracing.clear).pack(side=tk.RIGHT, padx=6)
+        tk.Button(controls, text="Export Trace", command=self.export_trace).pack(side=tk.RIGHT)
+
+        columns = ("count", "total", "mean", "max", "peak")
+        self.profiler_table = ttk.Treeview(window, columns=columns)
+        self.profiler_table.heading("#0", text="Span")
+        self.profiler_table.column("#0", width=200)
+        for column, title in zip(columns, ("Count", "Total ms", "Mean ms", "Max ms", "Peak MB")):
+            self.profiler_table.heading(column, text=title)
+            self.profiler_table.column(column, width=70, anchor=tk.E)
+        self.profiler_table.pack(side=tk.TOP, expand=True, fill=tk.BOTH)
+        self._refresh_profiler()
+
+    def _on_tracing_toggle(self):
+        if self.trace_var.get():
+            tracing.enable(memory=self.trace_memory_var.get())
+        else:
+            tracing.disable()
+
+    def _refresh_profiler(self):
+        if self.profiler_window is None:
+            return
+        self.profiler_table.delete(*self.profiler_table.get_children())
+        for row in tracing.summary():
+            peak = "--" if row["peak_mb"] is None else f"{row['peak_mb']:.1f}"
+            self.profiler_table.insert("", tk.END, text=row["name"], values=(
+                row["count"], f"{row['total_ms']:.1f}", f"{row['mean_ms']:.1f}", f"{row['max_ms']:.1f}", peak))
+        self._profiler_after = self.profiler_window.after(1000, self._refresh_profiler)
+
+    def _close_profiler(self):
+        # Destroying the window deletes the refresh callback, so a pending one must not fire
+        self.profiler_window.after_cancel(self._profiler_after)
+        self.profiler_window.destroy()
+        self.profiler_window = None
+
+    def export_trace(self):
+        os.makedirs('outputs', exist_ok=True)
+        save_path = filedialog.asksaveasfilename(
+            initialdir='outputs',
+            initialfile='trace.json',
+            defaultextension='.json',
+            filetypes=[('Chrome trace', '*.json')]
+        )
+        if not save_path:
+            return
+        count = tracing.export_chrome_trace(save_path)
+        print(f"Saved {count} span(s) to {save_path} (open in chrome://tracing or ui.perfetto.dev)")
+
+    # --- Background Jobs ---
+
+    def _start_job(self, work, on_done, description):
+        """Runs work(progress, cancel) off the Tk thread and passes its result to on_done on the Tk thread.
+
+        Starting a job supersedes the previous one, whose result is dropped.
+        """
+        self._invalidate_job()
+        job_id = self.job_id
+        cancel = threading.Event()
+        self.job_cancel = cancel
+
+        def progress(done, total):
+            self.ui_queue.put(("progress", job_id, done / total))
+
+        def run():
+            try:
+                self.ui_queue.put(("done", job_id, on_done, work(progress, cancel)))
+            except JobCancelled:
+                self.ui_queue.put(("cancelled", job_id, description))
+            except Exception as exc:
+                self.ui_queue.put(("error", job_id, description, exc))
+
+        self.btn_cancel.config(state=tk.NORMAL)
+        self.executor.submit(run)
+        if not self._polling:
+            self._polling = True
+            self.root.after(50, self._poll_jobs)
+
+    def _poll_jobs(self):
+        """Handles queued job messages on the Tk thread, ignoring those from stale jobs."""
+        while True:
+            try:
+                message = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            kind, job_id = message[:2]
+            if job_id != self.job_id:
+                continue
+            if kind == "progress":
+                self.progress.config(value=message[2])
+                continue
+            self._finish_job()
+            if kind == "done":
+                message[2](message[3])
+            elif kind == "cancelled":
+                print(f"{message[2]} cancelled.")
+            else:
+                print(f"{message[2]} failed: {message[3]}")
+
+        if self.job_cancel is not None:
+            self.root.after(50, self._poll_jobs)
+        else:
+            self._polling = False
+
+    def _finish_job(self):
+        self.job_cancel = None
+        self.btn_cancel.config(state=tk.DISABLED)
+        self.progress.config(value=0)
+
+    def _invalidate_job(self):
+        """Cancels the running job, if any, and makes sure its result is never drawn."""
+        if self.job_cancel is not None:
+            self.job_cancel.set()
+        self.job_id += 1
+        self._finish_job()
+
+    def cancel_job(self):
+        if self.job_cancel is None:
+            return
+        print("Cancelling current job...")
+        self._invalidate_job()
+
+    def on_close(self):
+        self._invalidate_job()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.root.destroy()
+
+    # ---- Noise and save UI actions ----
+    def add_noise(self):
+        if self.original_image is None:
+            print("Load an image first before adding noise.")
+            return
+
+        choice = self.selected_noise.get()
+        sigma = float(self.gauss_sigma_var.get())
+        sp_amount = float(self.sp_amount_var.get())
+        seed = self.noise_seed_var.get().strip()
+        try:
+            seed = int(seed) if seed else None
+            if seed is not None and seed < 0:
+                raise ValueError
+        except ValueError:
+            print(f"Error: the noise seed must be a whole number >= 0 or blank, not {seed!r}.")
+            return
+        noise = NoiseEngine.for_key(seed, self.image_path) if seed is not None else None
+        # New noise means a new source, so the comparison results no longer apply
+        self._close_comparison()
+
+        if choice == "None":
+            self._invalidate_job()
+            self.noisy_image = None
+            self.noisy_metrics = None
+            print("No noise added.")
+            # clear noisy canvas
+            self._clear_canvas(self.canvas_processed)
+            self._calculate_and_display_metrics()
+            return
+
+        original, processed = self.original_image, self.processed_image
+        fast = self.fast_ssim_var.get()
+
+        def work(progress, cancel):
+            with tracing.span("add_noise", cat="noise", noise=choice):
+                noisy = self.make_noisy(original, choice, sigma=sigma, sp_amount=sp_amount, noise=noise)
+            return noisy, self._metric_values(original, noisy, processed, None, fast)
+
+        def done(result):
+            self.noisy_image, values = result
+            self.noisy_metrics = (values["psnr_noisy"], values["ssim_noisy"])
+            print(f"Added noise: {choice} (sigma={sigma}, sp_amount={sp_amount})")
+            self.display_image(self.noisy_image, self.canvas_processed)
+            self._show_metrics(values)
+
+        self._start_job(work, done, f"Noise '{choice}'")
+
+    def save_noisy(self):
+        if getattr(self, 'noisy_image', None) is None:
+            print("No noisy image to save.")
+            return
+        # Ensure outputs directory exists
+        os.makedirs('outputs', exist_ok=True)
+        save_path = filedialog.asksaveasfilename(
+            initialdir='outputs',
+            initialfile='noisy.png',
+            defaultextension='.png', 
+            filetypes=[('PNG','*.png'),('JPEG','*.jpg;*.jpeg'),('NumPy (mapped)','*.npy'),('TIFF (mapped)','*.tif;*.tiff')]
+        )
+        if not save_path:
+            return
+        storage.write_image(save_path, self.noisy_image)
+        print(f"Saved noisy image to {save_path}")
+
+    def save_processed(self):
+        if getattr(self, 'processed_image', None) is None:
+            print("No processed image to save.")
+            return
+        # Ensure outputs directory exists
+        os.makedirs('outputs', exist_ok=True)
+        # Generate default filename based on selected filter
+        filter_name = self.selected_filter.get().lower().replace(' ', '_').replace('-', '')
+        default_name = f"{filter_name}.png"
+        save_path = filedialog.asksaveasfilename(
+            initialdir='outputs',
+            initialfile=default_name,
+            defaultextension='.png', 
+            filetypes=[('PNG','*.png'),('JPEG','*.jpg;*.jpeg'),('NumPy (mapped)','*.npy'),('TIFF (mapped)','*.tif;*.tiff')]
+        )
+        if not save_path:
+            return
+        storage.write_image(save_path, self.processed_image)
+        print(f"Saved processed image to {save_path}")
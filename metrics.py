@@ -0,0 +1,123 @@
+# metrics.py
+"""Image quality metrics: PSNR, exact SSIM (scikit-image) and a fast SSIM.
+
+The fast SSIM follows Wang et al.: an 11x11 Gaussian window (sigma 1.5)
+applied with OpenCV's separable filter in float32, optionally on a
+downsampled copy or a region of interest. At full resolution it matches
+skimage's ``structural_similarity(..., gaussian_weights=True,
+use_sample_covariance=False)`` to float32 precision.
+
+scikit-image is imported by ssim() on first use, so importing this module
+stays cheap.
+"""
+
+import cv2
+import numpy as np
+
+import tracing
+
+
+def psnr(reference, image, data_range=255):
+    """PSNR in dB. The squared error is summed in C without float64 copies of the images."""
+    mse = cv2.norm(reference, image, cv2.NORM_L2SQR) / reference.size
+    if mse == 0:
+        return float("inf")
+    return float(10 * np.log10(data_range ** 2 / mse))
+
+
+def ssim(reference, image, data_range=255):
+    """Exact SSIM with scikit-image defaults (7x7 uniform window), averaged over channels."""
+    # Imported on first use: scikit-image pulls in SciPy, which most callers never need
+    from skimage.metrics import structural_similarity
+
+    channel_axis = 2 if reference.ndim == 3 else None
+    try:
+        return float(structural_similarity(reference, image, data_range=data_range, channel_axis=channel_axis))
+    except TypeError:
+        # scikit-image < 0.19
+        return float(structural_similarity(reference, image, data_range=data_range,
+                                           multichannel=channel_axis is not None))
+
+
+class SSIMReference:
+    """Blurred statistics of a reference image for fast SSIM, computed once and reused for several images.
+
+    downsample: integer factor, or "auto" for Wang's max(1, round(min(H, W) / 256)).
+    roi: optional (y, x, height, width) region evaluated instead of the whole image.
+    """
+
+    def __init__(self, reference, data_range=255, sigma=1.5, downsample=1, roi=None):
+        self.roi = roi
+        self.sigma = sigma
+        self.radius = int(3.5 * sigma + 0.5)
+        self.c1 = (0.01 * data_range) ** 2
+        self.c2 = (0.03 * data_range) ** 2
+        region = self._crop(reference)
+        self.downsample = max(1, round(min(region.shape[:2]) / 256)) if downsample == "auto" else downsample
+        self.x = self._prepare(reference)
+        self.mu_x = self._blur(self.x)
+        self.mu_xx = self.mu_x * self.mu_x
+        self.sigma_xx = self._blur(self.x * self.x) - self.mu_xx
+
+    def _crop(self, image):
+        if self.roi is None:
+            return image
+        y, x, h, w = self.roi
+        return image[y:y + h, x:x + w]
+
+    def _prepare(self, image):
+        image = self._crop(image)
+        if self.downsample > 1:
+            size = (image.shape[1] // self.downsample, image.shape[0] // self.downsample)
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        return image.astype(np.float32)
+
+    def _blur(self, a):
+        ksize = (2 * self.radius + 1, 2 * self.radius + 1)
+        return cv2.GaussianBlur(a, ksize, self.sigma, borderType=cv2.BORDER_REFLECT)
+
+    def ssim(self, image):
+        """Gaussian-window SSIM of image against the reference, averaged over channels."""
+        y = self._prepare(image)
+        mu_y = self._blur(y)
+        mu_yy, mu_xy = mu_y * mu_y, self.mu_x * mu_y
+        sigma_yy = self._blur(y * y) - mu_yy
+        sigma_xy = self._blur(self.x * y) - mu_xy
+
+        numerator = (2 * mu_xy + self.c1) * (2 * sigma_xy + self.c2)
+        denominator = (self.mu_xx + mu_yy + self.c1) * (self.sigma_xx + sigma_yy + self.c2)
+        ssim_map = numerator / denominator
+
+        # Ignore the border where the window leaves the image, like scikit-image
+        r = self.radius
+        ssim_map = ssim_map[r:-r or None, r:-r or None]
+        return float(ssim_map.mean(dtype=np.float64))
+
+
+def fast_ssim(reference, image, data_range=255, sigma=1.5, downsample=1, roi=None):
+    """Gaussian-window SSIM in float32, averaged over channels.
+
+    downsample: integer factor, or "auto" for Wang's max(1, round(min(H, W) / 256)).
+    roi: optional (y, x, height, width) region evaluated instead of the whole image.
+    Use SSIMReference directly to compare several images against one reference.
+    """
+    return SSIMReference(reference, data_range, sigma, downsample, roi).ssim(image)
+
+
+def compute(reference, image, fast=False, ssim_reference=None, **fast_options):
+    """Returns (PSNR, SSIM) of image against reference, resizing image only if the shapes differ.
+
+    ssim_reference is an SSIMReference of reference built with the same
+    fast_options; when given, the fast SSIM reuses its statistics.
+    """
+    h, w = reference.shape[:2]
+    if image.shape[:2] != (h, w):
+        image = cv2.resize(image, (w, h))
+    with tracing.span("fast ssim" if fast else "ssim", cat="metrics"):
+        if fast:
+            ssim_value = (ssim_reference or SSIMReference(reference, **fast_options)).ssim(image)
+        else:
+            ssim_value = ssim(reference, image)
+    with tracing.span("psnr", cat="metrics"):
+        psnr_value = psnr(reference, image)
+    return psnr_value, ssim_value
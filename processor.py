@@ -0,0 +1,505 @@
+# processor.py
+"""Headless image pipeline: filters run tiled and cached, noise, metrics, portrait mode and disk streaming.
+
+Shared by the GUI, batch, bench and sweep. Importing it loads NumPy and
+OpenCV but neither Tk nor scikit-image, so short-lived workers start fast.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+import cv2
+import numpy as np
+
+import filters
+import metrics
+import storage
+import tracing
+from noise import NoiseEngine
+
+
+class JobCancelled(Exception):
+    """Raised inside a filter run when its cancel event is set."""
+
+
+class ImageProcessor:
+    """Filters, noise and metrics shared by the GUI and the batch CLI. Needs no Tk root."""
+
+    FILTER_OPTIONS = [
+        "Guided Filter",
+        "Rolling Guidance Filter",
+        "Kuwahara Filter",
+        "Kuwahara Filter (Entropy-based)"
+    ]
+    NOISE_OPTIONS = ["None", "Gaussian", "Salt & Pepper", "Both"]
+    # How the entropy Kuwahara filter picks quadrants on color images; see filters.kuwahara_entropy_filter
+    ENTROPY_SELECTIONS = ["channel", "luminance", "sum"]
+
+    def __init__(self, cache=None, seed=None, entropy_selection="channel"):
+        # Optional ResultCache for filter outputs and metrics
+        self.cache = cache
+        # Noise source; a seed makes every noisy image reproducible
+        self.noise = NoiseEngine(seed)
+        if entropy_selection not in self.ENTROPY_SELECTIONS:
+            raise ValueError(f"Unknown quadrant selection: {entropy_selection!r}")
+        self.entropy_selection = entropy_selection
+
+    def run_filter(self, image, choice, workers=None, tile_rows=None, progress=None, cancel=None, out=None):
+        """Applies the named filter to image, tiled over `workers` threads.
+
+        progress(done, total) is called as bands finish. Setting the `cancel`
+        event stops the run before its next band and raises JobCancelled.
+        Bands are written into `out` when given (e.g. a mapped file), which
+        bypasses the cache.
+        """
+        func, params, halo = self._filter_plan(choice)
+        with tracing.span(choice, cat="filter", shape=list(image.shape)):
+            key = None
+            if self.cache is not None and out is None:
+                key = self.cache.key(self.cache.digest(image), choice, params)
+                cached = self.cache.get(key)
+                if cached is not None:
+                    if progress is not None:
+                        progress(1, 1)
+                    return cached
+
+            result = self._run_tiled(lambda tile: func(tile, **params), image, halo, tile_rows=tile_rows,
+                                     workers=workers, progress=progress, cancel=cancel, out=out)
+            if key is not None:
+                self.cache.put(key, result)
+            return result
+
+    def cached_filter_result(self, image, choice, hash_image=True):
+        """Returns the cached output of the named filter on image without computing it, or None.
+
+        hash_image=False skips the lookup unless image was hashed before,
+        so the call stays cheap on the Tk thread.
+        """
+        digest = self.cache.digest(image, compute=hash_image) if self.cache is not None else None
+        if digest is None:
+            return None
+        _, params, _ = self._filter_plan(choice)
+        return self.cache.get(self.cache.key(digest, choice, params))
+
+    def make_noisy(self, image, choice, sigma=25.0, sp_amount=0.02, noise=None):
+        """Returns a noisy copy of image for the named noise model, or None for "None".
+
+        noise is a NoiseEngine to draw from instead of self.noise, e.g. one
+        from NoiseEngine.for_key for a fixed per-image seed. "Both" writes the
+        salt & pepper into the Gaussian output, so only one image is allocated.
+        """
+        if choice == "None":
+            return None
+        noise = noise or self.noise
+        noisy = None
+        if choice in ("Gaussian", "Both"):
+            with tracing.span("gaussian noise", cat="noise"):
+                noisy = noise.gaussian(image, sigma=sigma)
+        if choice in ("Salt & Pepper", "Both"):
+            with tracing.span("salt & pepper noise", cat="noise"):
+                noisy = noise.salt_pepper(image if noisy is None else noisy, amount=sp_amount, out=noisy)
+        return noisy
+
+    def make_noisy_variants(self, image, n, choice, sigma=25.0, sp_amount=0.02, noise=None):
+        """Returns n independent noisy copies of image stacked in one (n, H, W[, C]) array."""
+        with tracing.span("noise variants", cat="noise", noise=choice, n=n):
+            return (noise or self.noise).variants(image, n, choice, sigma=sigma, sp_amount=sp_amount)
+
+    def compute_metrics(self, reference, image, fast=False, ssim_reference=None, **fast_options):
+        """Returns (PSNR, SSIM) of image against reference, resizing image to match if needed.
+
+        fast=True uses the float32 Gaussian SSIM from metrics.fast_ssim, which
+        takes its downsample/roi options; ssim_reference optionally passes a
+        metrics.SSIMReference of reference shared between calls.
+        """
+        key = None
+        if self.cache is not None:
+            params = dict(image=self.cache.digest(image), fast=fast, **fast_options)
+            key = self.cache.key(self.cache.digest(reference), "metrics", params)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        with tracing.span("metrics", cat="metrics", fast=fast):
+            values = metrics.compute(reference, image, fast=fast, ssim_reference=ssim_reference, **fast_options)
+        if key is not None:
+            self.cache.put(key, values)
+        return values
+
+    # --- Filter Comparison ---
+
+    def compare_filters(self, original, source, choices=None, fast=False, workers=None, tile_rows=None,
+                        progress=None, cancel=None, **fast_options):
+        """Runs several filters on one source concurrently and scores each against original.
+
+        All runs share one read-only view of the source, which is hashed for
+        the cache once, and the fast SSIM's reference statistics are computed
+        once. Each filter's metrics run on its own thread as soon as it
+        finishes, so a comparison takes about as long as the slowest filter.
+        tile_rows is one band height for every filter, or a {filter name:
+        band height} dict. Returns {filter name: dict(image, seconds, psnr,
+        ssim)} in the order of choices (default: every filter).
+        """
+        choices = list(choices or self.FILTER_OPTIONS)
+        shared = source.view()
+        shared.setflags(write=False)
+        if self.cache is not None:
+            # Hash here instead of racing to hash in every filter thread
+            self.cache.digest(shared)
+            self.cache.digest(original)
+        ssim_reference = metrics.SSIMReference(original, **fast_options) if fast else None
+        fractions = dict.fromkeys(choices, 0.0)
+        lock = threading.Lock()
+
+        def band_progress(choice):
+            if progress is None:
+                return None
+
+            def report(done, total):
+                with lock:
+                    fractions[choice] = done / total
+                    overall = sum(fractions.values()) / len(fractions)
+                progress(overall, 1.0)
+            return report
+
+        def run(choice):
+            start = time.perf_counter()
+            rows = tile_rows.get(choice) if isinstance(tile_rows, dict) else tile_rows
+            image = self.run_filter(shared, choice, workers=workers, tile_rows=rows,
+                                    progress=band_progress(choice), cancel=cancel)
+            seconds = time.perf_counter() - start
+            psnr, ssim = self.compute_metrics(original, image, fast, ssim_reference=ssim_reference, **fast_options)
+            return choice, dict(image=image, seconds=seconds, psnr=psnr, ssim=ssim)
+
+        results = {}
+        with tracing.span("compare filters", cat="filter", filters=len(choices)):
+            with ThreadPoolExecutor(max_workers=len(choices)) as pool:
+                futures = [pool.submit(run, choice) for choice in choices]
+                try:
+                    for future in as_completed(futures):
+                        choice, result = future.result()
+                        results[choice] = result
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+        return {choice: results[choice] for choice in choices}
+
+    # --- Portrait Mode ---
+
+    # GrabCut segments a proxy of about this many pixels
+    PORTRAIT_PROXY_PIXELS = 250_000
+    PORTRAIT_ITERATIONS = 5
+    # Full-resolution GrabCut along the mask boundary, in square tiles of this side
+    PORTRAIT_REFINE_TILE = 128
+    PORTRAIT_REFINE_ITERATIONS = 1
+
+    def run_portrait(self, image, choice, workers=None, progress=None, cancel=None):
+        """Applies the named filter to the background only, leaving the segmented foreground untouched.
+
+        The foreground comes from portrait_mask, so trying several filters on
+        one image segments it once. progress(done, total) counts background
+        tiles; cancel works as in run_filter.
+        """
+        func, params, halo = self._filter_plan(choice)
+        with tracing.span(f"portrait {choice}", cat="filter", shape=list(image.shape)):
+            key = None
+            if self.cache is not None:
+                key = self._portrait_key(image, choice)
+                cached = self.cache.get(key)
+                if cached is not None:
+                    if progress is not None:
+                        progress(1, 1)
+                    return cached
+
+            mask = self.portrait_mask(image, workers=workers, cancel=cancel)
+            result = self._create_portrait_effect(image, lambda tile: func(tile, **params), mask, halo=halo,
+                                                  workers=workers, progress=progress, cancel=cancel)
+            if key is not None:
+                self.cache.put(key, result)
+            return result
+
+    def cached_portrait_result(self, image, choice, hash_image=True):
+        """Returns the cached portrait output of the named filter on image without computing it, or None.
+
+        hash_image works as in cached_filter_result.
+        """
+        digest = self.cache.digest(image, compute=hash_image) if self.cache is not None else None
+        if digest is None:
+            return None
+        return self.cache.get(self._portrait_key(image, choice, digest))
+
+    def _portrait_key(self, image, choice, digest=None):
+        _, params, _ = self._filter_plan(choice)
+        return self.cache.key(digest or self.cache.digest(image), "portrait", dict(params, filter=choice))
+
+    def portrait_mask(self, image, workers=None, cancel=None):
+        """Returns a boolean foreground mask of image, cached per image.
+
+        GrabCut, seeded with the central 80% of the frame, segments a
+        downscaled proxy. Its mask is upsampled and only the band along its
+        boundary, where the upsampled edge is uncertain, is segmented again
+        at full resolution.
+        """
+        key = None
+        if self.cache is not None:
+            params = dict(proxy_pixels=self.PORTRAIT_PROXY_PIXELS, iterations=self.PORTRAIT_ITERATIONS,
+                          refine_tile=self.PORTRAIT_REFINE_TILE, refine_iterations=self.PORTRAIT_REFINE_ITERATIONS)
+            key = self.cache.key(self.cache.digest(image), "portrait mask", params)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        with tracing.span("portrait mask", cat="filter", shape=list(image.shape)):
+            h, w = image.shape[:2]
+            scale = min(1.0, np.sqrt(self.PORTRAIT_PROXY_PIXELS / (h * w)))
+            proxy = image
+            if scale < 1.0:
+                size = (max(1, round(w * scale)), max(1, round(h * scale)))
+                proxy = cv2.resize(np.asarray(image), size, interpolation=cv2.INTER_AREA)
+            with tracing.span("grabcut", cat="filter", shape=list(proxy.shape)):
+                ph, pw = proxy.shape[:2]
+                rect = (int(pw * 0.1), int(ph * 0.1), int(pw * 0.8), int(ph * 0.8))
+                labels = np.zeros((ph, pw), np.uint8)
+                cv2.grabCut(self._grabcut_input(proxy), labels, rect, np.zeros((1, 65), np.float64),
+                            np.zeros((1, 65), np.float64), self.PORTRAIT_ITERATIONS, cv2.GC_INIT_WITH_RECT)
+            if scale < 1.0:
+                labels = self._refine_portrait_labels(image, labels, workers=workers, cancel=cancel)
+            # GC_FGD and GC_PR_FGD are the odd labels
+            mask = (labels & 1).astype(bool)
+
+        if key is not None:
+            self.cache.put(key, mask)
+        return mask
+
+    def _grabcut_input(self, image):
+        """GrabCut takes contiguous 3-channel uint8 images only."""
+        if image.ndim == 2:
+            return cv2.cvtColor(np.asarray(image), cv2.COLOR_GRAY2RGB)
+        return np.ascontiguousarray(image)
+
+    def _refine_portrait_labels(self, image, proxy_labels, workers=None, cancel=None):
+        """Upsamples proxy GrabCut labels to image size and re-runs GrabCut on the tiles along the boundary.
+
+        Pixels within a proxy pixel of the boundary become "probable" labels
+        and everything else is fixed, so each tile's GrabCut can only move
+        the edge inside that band.
+        """
+        h, w = image.shape[:2]
+        proxy_fg = ((proxy_labels & 1) * 255).astype(np.uint8)
+        kernel = np.ones((3, 3), np.uint8)
+        proxy_band = (cv2.dilate(proxy_fg, kernel) != cv2.erode(proxy_fg, kernel)).astype(np.uint8)
+
+        labels = (cv2.resize(proxy_fg, (w, h), interpolation=cv2.INTER_LINEAR) >= 128).astype(np.uint8)
+        band = cv2.resize(proxy_band, (w, h), interpolation=cv2.INTER_NEAREST).view(bool)
+        labels[band] += cv2.GC_PR_BGD  # GC_BGD -> GC_PR_BGD, GC_FGD -> GC_PR_FGD
+
+        size = self.PORTRAIT_REFINE_TILE
+        tiles = [(top, left) for top in range(0, h, size) for left in range(0, w, size)
+                 if band[top:top + size, left:left + size].any()]
+
+        def refine_tile(top, left):
+            if cancel is not None and cancel.is_set():
+                raise JobCancelled()
+            tile = labels[top:top + size, left:left + size]
+            foreground = tile & 1
+            if foreground.all() or not foreground.any():
+                # GrabCut needs both classes to model
+                return
+            tile_labels = tile.copy()
+            with tracing.span("grabcut tile", cat="tile", rows=[top, top + tile.shape[0]], cols=[left, left + tile.shape[1]]):
+                cv2.grabCut(self._grabcut_input(image[top:top + size, left:left + size]), tile_labels, None,
+                            np.zeros((1, 65), np.float64), np.zeros((1, 65), np.float64),
+                            self.PORTRAIT_REFINE_ITERATIONS, cv2.GC_INIT_WITH_MASK)
+            tile[...] = tile_labels
+
+        if tiles:
+            workers = workers or os.cpu_count() or 1
+            with ThreadPoolExecutor(max_workers=min(workers, len(tiles))) as pool:
+                futures = [pool.submit(refine_tile, top, left) for top, left in tiles]
+                try:
+                    for future in as_completed(futures):
+                        future.result()
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+        return labels
+
+    def _create_portrait_effect(self, image, background_filter_func, foreground_mask, halo=0,
+                                workers=None, progress=None, cancel=None):
+        """Filters the background of image and composites it around the untouched foreground.
+
+        Only square tiles holding background pixels are filtered, each
+        extended by halo so its pixels match a whole-image run, and their
+        background pixels are copied straight into a copy of image.
+        """
+        h, w = image.shape[:2]
+        output = np.array(image)
+        background = ~foreground_mask
+        # Large enough that the halo stays a modest overhead
+        size = max(256, 8 * halo)
+        tiles = [(top, left) for top in range(0, h, size) for left in range(0, w, size)
+                 if background[top:top + size, left:left + size].any()]
+
+        def run_tile(top, left):
+            if cancel is not None and cancel.is_set():
+                raise JobCancelled()
+            bottom, right = min(top + size, h), min(left + size, w)
+            y0, y1 = max(top - halo, 0), min(bottom + halo, h)
+            x0, x1 = max(left - halo, 0), min(right + halo, w)
+            with tracing.span("tile", cat="tile", rows=[top, bottom], cols=[left, right]):
+                result = background_filter_func(image[y0:y1, x0:x1])
+            where = background[top:bottom, left:right]
+            np.copyto(output[top:bottom, left:right], result[top - y0:bottom - y0, left - x0:right - x0],
+                      where=where[..., None] if output.ndim == 3 else where)
+
+        if tiles:
+            workers = workers or os.cpu_count() or 1
+            with ThreadPoolExecutor(max_workers=min(workers, len(tiles))) as pool:
+                futures = [pool.submit(run_tile, top, left) for top, left in tiles]
+                try:
+                    for done, future in enumerate(as_completed(futures), start=1):
+                        future.result()
+                        if progress is not None:
+                            progress(done, len(tiles))
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+        return output
+
+    # --- Disk-to-Disk Streaming ---
+
+    # Source bytes per band; filters work on several float32 copies of a band at once
+    STREAM_BAND_BYTES = 8 << 20
+
+    def filter_file(self, src_path, dst_path, choice, workers=None, progress=None, cancel=None):
+        """Filters a mapped .npy/.tif image into a new mapped file of the same format, band by band.
+
+        Only the bands in flight (plus their halos) are held in memory, so the
+        image may be larger than RAM. Returns the mapped output.
+        """
+        image = storage.open_image(src_path)
+        out = storage.create_image(dst_path, image.shape, image.dtype)
+        _, _, halo = self._filter_plan(choice)
+        tile_rows = storage.band_rows(image, self.STREAM_BAND_BYTES, min_rows=self._min_tile_rows(halo))
+        self.run_filter(image, choice, workers=workers, tile_rows=tile_rows, progress=progress, cancel=cancel, out=out)
+        out.flush()
+        return out
+
+    def noise_file(self, src_path, dst_path, choice, sigma=25.0, sp_amount=0.02, progress=None, cancel=None, noise=None):
+        """Writes a noisy copy of a mapped .npy/.tif image into a new mapped file, band by band.
+
+        Noise is independent per pixel, so each band gets the same model at
+        the same density as a whole-image run would. Bands are noised straight
+        into the output map.
+        """
+        image = storage.open_image(src_path)
+        out = storage.create_image(dst_path, image.shape, image.dtype)
+        rows = storage.band_rows(image, self.STREAM_BAND_BYTES)
+        tops = range(0, image.shape[0], rows)
+        with tracing.span("noise_file", cat="noise", noise=choice):
+            for done, top in enumerate(tops, start=1):
+                if cancel is not None and cancel.is_set():
+                    raise JobCancelled()
+                band = image[top:top + rows]
+                if choice == "None":
+                    out[top:top + rows] = band
+                else:
+                    (noise or self.noise).apply(band, choice, sigma, sp_amount, out=out[top:top + rows])
+                if progress is not None:
+                    progress(done, len(tops))
+        out.flush()
+        return out
+
+    # --- Tiled Execution ---
+
+    def _filter_plan(self, choice):
+        """Returns (filter function, keyword parameters, halo in pixels) for a filter name.
+
+        The halo is how far the filter reaches from an output pixel, so a tile
+        extended by it produces the same pixels as a run on the whole image.
+        """
+        if choice == "Guided Filter":
+            params = dict(radius=10, eps=4000)
+            # Box means of the coefficients, which are box means themselves
+            return filters.guided_filter, params, 2 * params["radius"]
+        if choice == "Rolling Guidance Filter":
+            params = dict(sigmaSpace=10, sigmaColor=30, numOfIter=4)
+            # One joint bilateral pass per iteration, radius cvRound(1.5 * sigmaSpace)
+            return filters.rolling_guidance_filter, params, params["numOfIter"] * round(1.5 * params["sigmaSpace"])
+        if choice == "Kuwahara Filter":
+            params = dict(kernel_size=11)
+            return filters.kuwahara_filter, params, (params["kernel_size"] - 1) // 2
+        if choice == "Kuwahara Filter (Entropy-based)":
+            params = dict(window_size=5, selection=self.entropy_selection)
+            return filters.kuwahara_entropy_filter, params, params["window_size"] - 1
+        raise ValueError(f"Unknown filter: {choice!r}")
+
+    def _min_tile_rows(self, halo, floor=64):
+        """Thinnest band worth filtering: every band also filters up to 2 * halo rows it then discards."""
+        return max(floor, 4 * halo)
+
+    def _run_tiled(self, func, image, halo, tile_rows=None, workers=None, progress=None, cancel=None, out=None):
+        """Runs func over overlapping horizontal bands of image on a thread pool and stitches the result.
+
+        Each band is extended by halo rows on both sides (clipped at the image
+        border) and only its core rows are kept, so the output is identical
+        to func(image). OpenCV, SciPy and NumPy release the GIL for the heavy
+        work, so threads scale without copying the image to other processes.
+        The result is stitched into `out` when given, else into a new array.
+        At most two bands per worker are in flight, and each band's result is
+        dropped once stitched, so streaming into a mapped `out` holds only a
+        few bands in memory however tall the image is.
+        """
+        h = image.shape[0]
+        workers = workers or os.cpu_count() or 1
+        if tile_rows is None:
+            # A couple of bands per worker evens out uneven band costs, as long
+            # as the halos stay a small part of each band
+            tile_rows = h if workers == 1 else max(self._min_tile_rows(halo), -(-h // (2 * workers)))
+        tops = range(0, h, tile_rows)
+
+        def run_band(top):
+            if cancel is not None and cancel.is_set():
+                raise JobCancelled()
+            bottom = min(top + tile_rows, h)
+            lo, hi = max(top - halo, 0), min(bottom + halo, h)
+            with tracing.span("tile", cat="tile", rows=[top, bottom]):
+                result = func(image[lo:hi])
+            return top, bottom, result[top - lo:bottom - lo]
+
+        output = out
+        done = 0
+
+        def stitch(finished):
+            nonlocal output, done
+            for future in finished:
+                top, bottom, core = future.result()
+                if output is None:
+                    output = np.empty((h,) + core.shape[1:], dtype=core.dtype)
+                output[top:bottom] = core
+                done += 1
+                if progress is not None:
+                    progress(done, len(tops))
+
+        workers = min(workers, len(tops))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            in_flight = set()
+            try:
+                for top in tops:
+                    if len(in_flight) >= 2 * workers:
+                        finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        stitch(finished)
+                    in_flight.add(pool.submit(run_band, top))
+                while in_flight:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    stitch(finished)
+            except BaseException:
+                for future in in_flight:
+                    future.cancel()
+                raise
+        return output
@@ -0,0 +1,93 @@
+# storage.py
+"""Memory-mapped image storage, so filters and noise can stream band by band from disk to disk.
+
+Large images live in uncompressed .npy files, or in contiguous uncompressed
+.tif/.tiff files (via tifffile). These are mapped into memory rather than
+read: only the bands being processed are paged in, and results are written
+band by band into a mapped output file. Pixels are stored RGB like
+everywhere else in the workbench, so mapped files need no channel swap.
+Files OpenCV decodes (JPEG, PNG, ...) are turned from BGR to RGB in place.
+"""
+
+import os
+
+import cv2
+import numpy as np
+
+import tracing
+
+MEMMAP_EXTENSIONS = (".npy", ".tif", ".tiff")
+# Rows per band when copying to or from a mapped file
+COPY_BAND_BYTES = 64 << 20
+
+
+def is_memmap_path(path):
+    return path.lower().endswith(MEMMAP_EXTENSIONS)
+
+
+def _tifffile():
+    try:
+        import tifffile
+    except ImportError as exc:
+        raise ImportError("Memory-mapped TIFF needs the tifffile package (pip install tifffile)") from exc
+    return tifffile
+
+
+def open_image(path, mode="r"):
+    """Maps an .npy or contiguous uncompressed TIFF image without reading it; mode "r+" allows edits."""
+    if path.lower().endswith(".npy"):
+        return np.load(path, mmap_mode=mode)
+    try:
+        return _tifffile().memmap(path, mode=mode)
+    except ValueError as exc:
+        raise ValueError(f"{path} is compressed or not contiguous and cannot be mapped; "
+                         "convert it to .npy first") from exc
+
+
+def create_image(path, shape, dtype=np.uint8):
+    """Creates a writable mapped image file of the given shape; pixels start at zero."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if path.lower().endswith(".npy"):
+        return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=tuple(shape))
+    photometric = "rgb" if len(shape) == 3 and shape[2] == 3 else "minisblack"
+    return _tifffile().memmap(path, shape=tuple(shape), dtype=dtype, photometric=photometric)
+
+
+def band_rows(image, band_bytes=COPY_BAND_BYTES, min_rows=1):
+    """Rows per band so one band of image takes about band_bytes."""
+    row_bytes = max(1, image.nbytes // max(1, image.shape[0]))
+    return max(min_rows, band_bytes // row_bytes)
+
+
+def read_image(path):
+    """Returns an RGB image: mapped read-only for .npy/.tif(f), decoded into memory otherwise (None if unreadable)."""
+    if is_memmap_path(path) and os.path.exists(path):
+        try:
+            return open_image(path)
+        except ValueError:
+            if not path.lower().endswith((".tif", ".tiff")):
+                raise
+            # Compressed or tiled TIFF: fall back to decoding it whole
+    with tracing.span("imread", cat="io"):
+        image = cv2.imread(path)
+    if image is not None and image.ndim == 3:
+        with tracing.span("cvtColor", cat="io"):
+            cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+    return image
+
+
+def write_image(path, image):
+    """Saves an RGB image. Mapped formats are written band by band; others go through cv2.imwrite."""
+    if is_memmap_path(path):
+        out = create_image(path, image.shape, image.dtype)
+        rows = band_rows(image)
+        for top in range(0, image.shape[0], rows):
+            out[top:top + rows] = image[top:top + rows]
+        out.flush()
+        return path
+    if image.ndim == 3:
+        # OpenCV encoders want BGR; this is the one copy left on the save path
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    if not cv2.imwrite(path, image):
+        raise IOError(f"could not write {path}")
+    return path
@@ -0,0 +1,276 @@
+# sweep.py
+"""Parameter sweeps: evaluate a grid of settings per filter and report the PSNR/SSIM vs runtime Pareto front.
+
+Grid points share their expensive intermediates instead of starting over:
+  - Kuwahara: integral images of the padded source and its square serve
+    every kernel size
+  - Entropy Kuwahara: the quantized bins serve every window size
+  - Rolling guidance: iteration k feeds iteration k + 1, so every numOfIter
+    up to the largest comes out of one chain per (sigmaSpace, sigmaColor)
+
+Runtimes are what the production filter would take on the full image. For
+rolling guidance that is the chain's own cumulative time, since its first k
+iterations are exactly a numOfIter=k run. The other filters are timed on a
+center crop and scaled by pixel count.
+
+Example:
+    python sweep.py images/a.jpg --filters "Kuwahara Filter" "Guided Filter" --grid kernel_size=5,7,9,11 --report outputs/sweep.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+import filters
+import storage
+from processor import ImageProcessor
+from noise import NoiseEngine
+
+DEFAULT_GRIDS = {
+    "Guided Filter": dict(radius=[5, 10, 20], eps=[1000, 4000, 16000]),
+    "Rolling Guidance Filter": dict(sigmaSpace=[5, 10], sigmaColor=[15, 30, 60], numOfIter=[1, 2, 3, 4, 5, 6]),
+    "Kuwahara Filter": dict(kernel_size=[5, 7, 9, 11, 15, 21]),
+    "Kuwahara Filter (Entropy-based)": dict(window_size=[3, 5, 7, 9], bins=[16, 32, 64], selection=["channel"]),
+}
+
+
+def grid_points(grid):
+    """Yields every combination of a {param: [values]} grid as a params dict."""
+    names = list(grid)
+    for values in itertools.product(*(grid[name] for name in names)):
+        yield dict(zip(names, values))
+
+
+def center_crop(image, max_pixels):
+    h, w = image.shape[:2]
+    scale = min(1.0, np.sqrt(max_pixels / (h * w)))
+    ch, cw = max(1, int(h * scale)), max(1, int(w * scale))
+    top, left = (h - ch) // 2, (w - cw) // 2
+    return image[top:top + ch, left:left + cw]
+
+
+def time_production(processor, name, image, params, timing_pixels, repeat):
+    """Seconds the production filter would take on image, timed on a center crop and scaled by area."""
+    func, _, _ = processor._filter_plan(name)
+    crop = center_crop(image, timing_pixels)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(crop, **params)
+        best = min(best, time.perf_counter() - start)
+    return best * (image.shape[0] * image.shape[1]) / (crop.shape[0] * crop.shape[1])
+
+
+# --- Shared-intermediate sweeps ---
+# Each yields (params, output image, production seconds or None to time it separately).
+
+def integral_quadrants(sums, sq_sums, pad, shape, kernel_size):
+    """Yields float32 (mean, mean of squares) for the TL, TR, BL and BR quadrants from integral images.
+
+    sums and sq_sums are integrals of the source padded by pad with
+    BORDER_REFLECT, the border the Kuwahara filter's box filters use.
+    """
+    h, w = shape[:2]
+    r = (kernel_size - 1) // 2
+    size = r + 1
+    mean = np.empty(shape, dtype=np.float32)
+    sq_mean = np.empty_like(mean)
+
+    def box_mean(integral, oy, ox, out):
+        y0, x0 = oy + pad, ox + pad
+        y1, x1 = y0 + size, x0 + size
+        total = integral[y1:y1 + h, x1:x1 + w] - integral[y0:y0 + h, x1:x1 + w]
+        total -= integral[y1:y1 + h, x0:x0 + w]
+        total += integral[y0:y0 + h, x0:x0 + w]
+        # float32 sum times float32 scale, like OpenCV's box filter, so near-ties resolve the same way
+        np.multiply(total.astype(np.float32), np.float32(1.0 / (size * size)), out=out)
+
+    for oy, ox in [(-r, -r), (-r, 0), (0, -r), (0, 0)]:  # TL, TR, BL, BR
+        box_mean(sums, oy, ox, mean)
+        box_mean(sq_sums, oy, ox, sq_mean)
+        yield mean, sq_mean
+
+
+def sweep_kuwahara(processor, image, grid):
+    pad = max((k - 1) // 2 for k in grid["kernel_size"])
+    padded = cv2.copyMakeBorder(image, pad, pad, pad, pad, cv2.BORDER_REFLECT)
+    sums, sq_sums = cv2.integral2(padded, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+    for params in grid_points(grid):
+        quadrants = integral_quadrants(sums, sq_sums, pad, image.shape, params["kernel_size"])
+        yield params, filters.min_variance_quadrant(quadrants, image.shape), None
+
+
+def sweep_entropy(processor, image, grid):
+    img_float = image.astype(np.float32)
+    img_float /= 255.0
+    for bins in grid["bins"]:
+        quantized = filters.quantize(img_float, bins)
+        for window_size, selection in itertools.product(grid["window_size"], grid["selection"]):
+            output = filters.kuwahara_entropy_filter(image, window_size, bins, selection, quantized=quantized)
+            yield dict(window_size=window_size, bins=bins, selection=selection), output, None
+
+
+def sweep_rolling_guidance(processor, image, grid):
+    iterations = sorted(grid["numOfIter"])
+    for sigma_space, sigma_color in itertools.product(grid["sigmaSpace"], grid["sigmaColor"]):
+        start = time.perf_counter()
+        output = cv2.ximgproc.rollingGuidanceFilter(image, sigmaSpace=sigma_space, sigmaColor=sigma_color, numOfIter=1)
+        for k in range(1, iterations[-1] + 1):
+            if k > 1:
+                # One more rolling-guidance iteration: the last result guides a joint bilateral pass
+                output = cv2.ximgproc.jointBilateralFilter(output, image, -1, sigma_color, sigma_space)
+            if k in iterations:
+                params = dict(sigmaSpace=sigma_space, sigmaColor=sigma_color, numOfIter=k)
+                yield params, output, time.perf_counter() - start
+
+
+def sweep_direct(processor, name, image, grid):
+    func, _, _ = processor._filter_plan(name)
+    for params in grid_points(grid):
+        start = time.perf_counter()
+        output = func(image, **params)
+        yield params, output, time.perf_counter() - start
+
+
+def sweep_filter(processor, name, clean, noisy, grid, timing_pixels=250_000, repeat=2, fast_ssim=False):
+    """Evaluates every grid point of one filter on noisy; returns one record per point."""
+    if name == "Kuwahara Filter":
+        points = sweep_kuwahara(processor, noisy, grid)
+    elif name == "Kuwahara Filter (Entropy-based)":
+        points = sweep_entropy(processor, noisy, grid)
+    elif name == "Rolling Guidance Filter":
+        points = sweep_rolling_guidance(processor, noisy, grid)
+    else:
+        points = sweep_direct(processor, name, noisy, grid)
+
+    fast_options = dict(downsample="auto") if fast_ssim else {}
+    records = []
+    for params, output, seconds in points:
+        if seconds is None:
+            seconds = time_production(processor, name, noisy, params, timing_pixels, repeat)
+        psnr, ssim = processor.compute_metrics(clean, output, fast_ssim, **fast_options)
+        records.append(dict(filter=name, params=params, seconds=round(seconds, 4), psnr=round(psnr, 4), ssim=round(ssim, 4)))
+    return records
+
+
+def pareto_front(records):
+    """Returns the records that no other record matches or beats on runtime, PSNR and SSIM at once, fastest first."""
+    def dominates(a, b):
+        no_worse = a["seconds"] <= b["seconds"] and a["psnr"] >= b["psnr"] and a["ssim"] >= b["ssim"]
+        better = a["seconds"] < b["seconds"] or a["psnr"] > b["psnr"] or a["ssim"] > b["ssim"]
+        return no_worse and better
+
+    front = [r for r in records if not any(dominates(other, r) for other in records)]
+    return sorted(front, key=lambda r: r["seconds"])
+
+
+def parse_grid_overrides(items):
+    """Parses "param=v1,v2" items into {param: [values]}; numbers become ints or floats, anything else stays a string."""
+    def parse(value):
+        for kind in (int, float):
+            try:
+                return kind(value)
+            except ValueError:
+                pass
+        return value.strip()
+
+    overrides = {}
+    for item in items or []:
+        name, _, values = item.partition("=")
+        if not values:
+            raise ValueError(f"expected param=v1,v2,... but got {item!r}")
+        overrides[name.strip()] = [parse(v) for v in values.split(",")]
+    return overrides
+
+
+def build_grids(filters, overrides):
+    """Default grids for the chosen filters, with overridden parameters replaced."""
+    grids = {name: dict(DEFAULT_GRIDS[name]) for name in filters}
+    for param, values in overrides.items():
+        owners = [name for name in grids if param in grids[name]]
+        if not owners:
+            raise ValueError(f"no selected filter takes {param!r}")
+        for name in owners:
+            grids[name][param] = values
+    return grids
+
+
+def print_records(title, records, front, show_filter=False):
+    """Prints records fastest first, starring those on the front."""
+    on_front = {id(r) for r in front}
+    print(f"\n{title}")
+    for r in sorted(records, key=lambda r: r["seconds"]):
+        params = ", ".join(f"{k}={v}" for k, v in r["params"].items())
+        if show_filter:
+            params = f"{r['filter']}: {params}"
+        marker = "*" if id(r) in on_front else " "
+        print(f" {marker} {r['seconds']:8.3f}s  PSNR {r['psnr']:6.2f} dB  SSIM {r['ssim']:.4f}  {params}")
+
+
+def run_sweep(args):
+    """Sweeps every selected filter on one image; returns (records, overall Pareto front)."""
+    clean = storage.read_image(args.image)
+    if clean is None:
+        raise SystemExit(f"could not read {args.image}")
+    processor = ImageProcessor()
+    noise = NoiseEngine.for_key(args.seed, args.image)
+    noisy = processor.make_noisy(clean, args.noise, sigma=args.sigma, sp_amount=args.sp_amount, noise=noise)
+    source = noisy if noisy is not None else clean
+
+    records = []
+    for name, grid in build_grids(args.filters, parse_grid_overrides(args.grid)).items():
+        filter_records = sweep_filter(processor, name, clean, source, grid, args.timing_pixels, args.repeat, args.fast_ssim)
+        front = pareto_front(filter_records)
+        for r in filter_records:
+            r["pareto_filter"] = any(r is f for f in front)
+        print_records(name, filter_records, front)
+        records.extend(filter_records)
+
+    front = pareto_front(records)
+    for r in records:
+        r["pareto"] = any(r is f for f in front)
+    print_records("Pareto front across filters", front, front, show_filter=True)
+    return records, front
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep filter parameters and report the quality/runtime Pareto front.")
+    parser.add_argument("image", help="clean reference image")
+    parser.add_argument("--filters", nargs="+", default=list(DEFAULT_GRIDS), choices=list(DEFAULT_GRIDS))
+    parser.add_argument("--grid", nargs="+", metavar="PARAM=V1,V2", help="replace a parameter's default values")
+    parser.add_argument("--noise", default="Gaussian", choices=ImageProcessor.NOISE_OPTIONS)
+    parser.add_argument("--sigma", type=float, default=25.0, help="Gaussian noise sigma")
+    parser.add_argument("--sp-amount", type=float, default=0.02, help="salt & pepper amount")
+    parser.add_argument("--seed", type=int, default=0, help="noise seed")
+    parser.add_argument("--fast-ssim", action="store_true", help="float32 Gaussian SSIM instead of scikit-image's")
+    parser.add_argument("--timing-pixels", type=int, default=250_000, help="crop size for timing production runs")
+    parser.add_argument("--repeat", type=int, default=2, help="timing runs per point; the fastest counts")
+    parser.add_argument("--report", default=os.path.join("outputs", "sweep.json"), help="JSON report path")
+    args = parser.parse_args(argv)
+    if args.repeat < 1 or args.timing_pixels < 1:
+        parser.error("--repeat and --timing-pixels must be at least 1")
+    if args.seed < 0:
+        parser.error("--seed must be at least 0")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        records, front = run_sweep(args)
+    except ValueError as exc:
+        raise SystemExit(f"error: {exc}")
+    os.makedirs(os.path.dirname(os.path.abspath(args.report)), exist_ok=True)
+    with open(args.report, "w") as f:
+        json.dump(dict(image=args.image, noise=args.noise, seed=args.seed, records=records, pareto=front), f, indent=2)
+    print(f"\nWrote {len(records)} record(s) to {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,43 @@
+"""Disk-to-disk streaming keeps memory flat as images grow."""
+
+import os
+import sys
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processor import ImageProcessor  # noqa: E402
+
+
+def filter_file_peak(tmp_path, height, width=400):
+    """Peak traced bytes of a single-threaded Kuwahara filter_file run on a height x width image."""
+    rng = np.random.default_rng(0)
+    src = str(tmp_path / f"src_{height}.npy")
+    np.save(src, rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+    processor = ImageProcessor()
+    # Small bands, so the test images span many of them
+    processor.STREAM_BAND_BYTES = 64 * width * 3
+    tracemalloc.start()
+    try:
+        out = processor.filter_file(src, str(tmp_path / f"dst_{height}.npy"), "Kuwahara Filter", workers=1)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak, out
+
+
+def test_filter_file_peak_memory_does_not_grow_with_height(tmp_path):
+    small, _ = filter_file_peak(tmp_path, 1000)
+    large, _ = filter_file_peak(tmp_path, 4000)
+    image_bytes = 4000 * 400 * 3
+    assert large < 1.5 * small
+    assert large < image_bytes / 2
+
+
+def test_filter_file_matches_in_memory_filter(tmp_path):
+    _, out = filter_file_peak(tmp_path, 300)
+    image = np.load(str(tmp_path / "src_300.npy"))
+    expected = ImageProcessor().run_filter(image, "Kuwahara Filter", workers=1)
+    assert np.array_equal(np.asarray(out), expected)
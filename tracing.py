@@ -0,0 +1,153 @@
+# tracing.py
+"""Timed spans around pipeline stages, summarized in the GUI or exported as Chrome-trace JSON.
+
+Tracing is off by default. While it is off, span() hands back a shared no-op
+context manager, so instrumented code pays one flag check per call. When it
+is on, every span records its wall time, and with memory=True also the bytes
+NumPy and Python allocated while it ran (via tracemalloc). Finished spans go
+to a bounded ring buffer that feeds summary() and export_chrome_trace(); open
+the exported file in chrome://tracing or https://ui.perfetto.dev.
+
+tracemalloc is process-wide, so the memory figures of spans running at the
+same time on different threads (e.g. filter tiles) include each other's
+allocations.
+"""
+
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+_enabled = False
+_memory = False
+_events = deque(maxlen=20000)
+_local = threading.local()
+_epoch = time.perf_counter()
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+class _Span:
+    __slots__ = ("name", "cat", "args", "start", "mem_start", "peak")
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.mem_start = None
+
+    def __enter__(self):
+        if _memory and tracemalloc.is_tracing():
+            stack = _stack()
+            current, peak = tracemalloc.get_traced_memory()
+            # reset_peak() below would lose the enclosing span's peak, so hand it up first
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            self.mem_start = self.peak = current
+            stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        args = self.args
+        if self.mem_start is not None and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, self.peak)
+            args = dict(args, alloc_bytes=current - self.mem_start, peak_bytes=peak - self.mem_start)
+            stack = _stack()
+            if stack and stack[-1] is self:
+                stack.pop()
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+        _events.append(dict(name=self.name, cat=self.cat, ph="X", pid=os.getpid(), tid=threading.get_ident(),
+                            ts=(self.start - _epoch) * 1e6, dur=(end - self.start) * 1e6, args=args))
+        return False
+
+
+def span(name, cat="pipeline", **args):
+    """Returns a context manager timing the enclosed block as one span (a no-op while tracing is off)."""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, cat, args)
+
+
+def enable(memory=False):
+    """Starts recording spans; memory=True also records allocated bytes, at some cost to Python-heavy code."""
+    global _enabled, _memory
+    _memory = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _enabled = True
+
+
+def disable():
+    global _enabled, _memory
+    _enabled = _memory = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def is_enabled():
+    return _enabled
+
+
+def clear():
+    _events.clear()
+
+
+def events():
+    """Returns a snapshot of the recorded spans, oldest first, as Chrome-trace "X" events."""
+    return list(_events)
+
+
+def summary():
+    """Aggregates the recorded spans by name, slowest total first.
+
+    Each row has name, count, total_ms, mean_ms, max_ms and peak_mb (None
+    when memory was not tracked).
+    """
+    rows = {}
+    for event in events():
+        row = rows.setdefault(event["name"], dict(name=event["name"], count=0, total_ms=0.0, max_ms=0.0, peak_mb=None))
+        ms = event["dur"] / 1000
+        row["count"] += 1
+        row["total_ms"] += ms
+        row["max_ms"] = max(row["max_ms"], ms)
+        peak = event["args"].get("peak_bytes")
+        if peak is not None:
+            row["peak_mb"] = max(row["peak_mb"] or 0.0, peak / 2**20)
+    for row in rows.values():
+        row["mean_ms"] = row["total_ms"] / row["count"]
+    return sorted(rows.values(), key=lambda row: row["total_ms"], reverse=True)
+
+
+def export_chrome_trace(path):
+    """Writes the recorded spans to path in the Chrome trace-event JSON format; returns the span count."""
+    trace_events = events()
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(dict(traceEvents=trace_events, displayTimeUnit="ms"), f)
+    return len(trace_events)